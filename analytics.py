@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Per line statistics of line files as column operations
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+import numpy as np
+
+from geo import haversine
+from lineinfo import LineInfo
+from lineinfo import gen_line_files
+
+
+__all__ = ['NetworkColumns', 'compute_stats', 'FIELDS']
+
+# output columns
+FIELDS = [
+    'file',
+    'name',
+    'code',
+    'stations',
+    'links',
+    'minutes',
+    'kilometers',
+    'avg_minutes',
+    'max_minutes',
+    'speed',
+    'geodesic_ratio',
+    'changes',
+    'transfer_stations',
+    'transfer_density',
+    ]
+
+
+class NetworkColumns(object):
+    """It keeps stations, links and changes of all lines as columns, each
+    row tagged with its line number.
+    """
+    def __init__(self):
+        self.files = []
+        self.names = []
+        self.codes = []
+        # python lists while adding, arrays after finish
+        self.station_counts = []
+        self.latitudes = []
+        self.longitudes = []
+        self.link_lines = []
+        self.link_begins = []
+        self.link_ends = []
+        self.kilometers = []
+        self.minutes = []
+        self.change_lines = []
+        self.change_idxs = []
+        self.station_offset = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, filename, line_info):
+        """append line, station idx becomes row of latitudes
+        Arguments:
+            filename -- line file name
+            line_info -- LineInfo object
+        """
+        line_pos = len(self.names)
+        self.files.append(filename)
+        self.names.append(line_info.line.name)
+        self.codes.append(line_info.line.code)
+        stations = line_info.stations
+        size = line_info.get_size()
+        latitudes = [0.0] * size
+        longitudes = [0.0] * size
+        for station in stations:
+            latitudes[station.idx] = station.latlong.latitude
+            longitudes[station.idx] = station.latlong.longitude
+        self.station_counts.append(len(stations))
+        self.latitudes.extend(latitudes)
+        self.longitudes.extend(longitudes)
+
+        offset = self.station_offset
+        links = line_info.links
+        self.link_lines.extend([line_pos] * len(links))
+        self.link_begins.extend([offset + link.begin_idx for link in links])
+        self.link_ends.extend([offset + link.end_idx for link in links])
+        self.kilometers.extend([link.kilometers for link in links])
+        self.minutes.extend([link.minutes for link in links])
+        self.change_lines.extend([line_pos] * len(line_info.changes))
+        self.change_idxs.extend([change.idx for change in line_info.changes])
+        self.station_offset += size
+
+    def finish(self):
+        """make arrays of columns
+        """
+        self.station_counts = np.array(self.station_counts, dtype=np.int64)
+        self.latitudes = np.array(self.latitudes, dtype=np.float64)
+        self.longitudes = np.array(self.longitudes, dtype=np.float64)
+        self.link_lines = np.array(self.link_lines, dtype=np.int64)
+        self.link_begins = np.array(self.link_begins, dtype=np.int64)
+        self.link_ends = np.array(self.link_ends, dtype=np.int64)
+        self.kilometers = np.array(self.kilometers, dtype=np.float64)
+        self.minutes = np.array(self.minutes, dtype=np.float64)
+        self.change_lines = np.array(self.change_lines, dtype=np.int64)
+        self.change_idxs = np.array(self.change_idxs, dtype=np.int64)
+
+    @classmethod
+    def load(cls, dirname):
+        """read line files one by one, objects are dropped after added
+        Arguments:
+            dirname -- directory of line files
+        """
+        columns = cls()
+        for filename in gen_line_files(dirname):
+            columns.add(filename, LineInfo.load(filename, None))
+        columns.finish()
+        return columns
+
+
+def divide(numerators, denominators):
+    """Return numerators / denominators, nan where denominator is zero.
+    """
+    result = np.full(len(numerators), np.nan)
+    valid = denominators != 0
+    result[valid] = numerators[valid] / denominators[valid]
+    return result
+
+
+def compute_stats(columns):
+    """Return dict of stat arrays, one value per line.
+    Arguments:
+        columns -- finished NetworkColumns object
+    """
+    count = len(columns)
+    lines = columns.link_lines
+
+    links = np.bincount(lines, minlength=count)
+    minutes = np.bincount(lines, weights=columns.minutes, minlength=count)
+    kilometers = np.bincount(lines, weights=columns.kilometers,
+                             minlength=count)
+    # nan for lines without links as other ratios
+    max_minutes = np.full(count, np.nan)
+    np.fmax.at(max_minutes, lines, columns.minutes)
+
+    # geodesic over track, links whose both stations have position
+    lat1 = columns.latitudes[columns.link_begins]
+    long1 = columns.longitudes[columns.link_begins]
+    lat2 = columns.latitudes[columns.link_ends]
+    long2 = columns.longitudes[columns.link_ends]
+    located = (((lat1 != 0) | (long1 != 0)) &
+               ((lat2 != 0) | (long2 != 0)) &
+               (columns.kilometers > 0))
+    geodesic = np.where(located, haversine(lat1, long1, lat2, long2, np),
+                        0.0)
+    geodesic_sum = np.bincount(lines, weights=geodesic, minlength=count)
+    track_sum = np.bincount(lines, weights=columns.kilometers * located,
+                            minlength=count)
+
+    # several changes of a station make one transfer station
+    change_keys = np.unique(columns.change_lines * (1 << 32) +
+                            columns.change_idxs)
+    changes = np.bincount(columns.change_lines, minlength=count)
+    transfer_stations = np.bincount(change_keys >> 32, minlength=count)
+
+    return {
+        'stations': columns.station_counts,
+        'links': links,
+        'minutes': minutes,
+        'kilometers': kilometers,
+        'avg_minutes': divide(minutes, links.astype(np.float64)),
+        'max_minutes': max_minutes,
+        'speed': divide(kilometers * 60, minutes),
+        'geodesic_ratio': divide(geodesic_sum, track_sum),
+        'changes': changes,
+        'transfer_stations': transfer_stations,
+        'transfer_density': divide(transfer_stations.astype(np.float64),
+                                   columns.station_counts.astype(np.float64)),
+        }
+
+
+def gen_rows(columns, stats):
+    """row dict generator, nan becomes None
+    Arguments:
+        columns -- NetworkColumns object
+        stats -- compute_stats result
+    """
+    for line_pos in range(len(columns)):
+        row = {
+            'file': columns.files[line_pos],
+            'name': columns.names[line_pos],
+            'code': columns.codes[line_pos],
+            }
+        for (key, values) in stats.items():
+            value = values[line_pos].item()
+            if isinstance(value, float):
+                if np.isnan(value):
+                    value = None
+                else:
+                    value = round(value, 4)
+            row[key] = value
+        yield row
+
+
+def write_csv(rows, out):
+    writer = csv.writer(out)
+    writer.writerow(FIELDS)
+    for row in rows:
+        values = []
+        for field in FIELDS:
+            value = row[field]
+            if value is None:
+                value = ''
+            elif isinstance(value, unicode):
+                value = value.encode('utf-8')
+            values.append(value)
+        writer.writerow(values)
+
+
+def write_json(rows, out):
+    out.write(json.dumps(list(rows), ensure_ascii=False,
+                         indent=1).encode('utf-8'))
+    out.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='line statistics')
+    parser.add_argument('--data', default='data',
+                        help='directory of line files')
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--output', help='output file, stdout if omitted')
+    args = parser.parse_args()
+
+    start = time.time()
+    columns = NetworkColumns.load(args.data)
+    loaded = time.time()
+    stats = compute_stats(columns)
+    computed = time.time()
+    out = sys.stdout
+    if args.output:
+        out = open(args.output, 'wb')
+    try:
+        write = args.format == 'csv' and write_csv or write_json
+        write(gen_rows(columns, stats), out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write('%d lines, %d links: load %.2f s, compute %.3f s\n' % (
+        len(columns), len(columns.link_lines),
+        loaded - start, computed - loaded))
+
+
+if __name__ == '__main__':
+    main()
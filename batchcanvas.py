@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Batched canvas item creation
+"""
+import Tkinter as Tk
+
+
+__all__ = ['BatchPainter']
+
+
+def flatten(coords):
+    """Return flat coordinate list.
+    Arguments:
+        coords -- numbers or (x, y) pairs
+    """
+    flat = []
+    for val in coords:
+        if isinstance(val, (tuple, list)):
+            flat.extend(val)
+        else:
+            flat.append(val)
+    return flat
+
+
+class BatchPainter(object):
+    """It gathers canvas items and creates them by a few Tcl scripts.
+
+    It has the subset of Tk.Canvas used by LineMap. create_* returns
+    a handle which is resolved to the canvas item id by get_id after flush.
+    """
+    def __init__(self, canvas, batch_size=512):
+        """
+        Arguments:
+            canvas -- Tk.Canvas
+            batch_size -- number of items in one script
+        """
+        self.canvas = canvas
+        self.batch_size = batch_size
+        self.commands = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.commands) + len(self.ids)
+
+    def add(self, kind, coords, options):
+        words = [self.canvas._w, 'create', kind]
+        words.extend(flatten(coords))
+        words.extend(self.canvas._options(options))
+        self.commands.append(u' '.join([Tk._stringify(word)
+                                        for word in words]))
+        return len(self) - 1
+
+    def create_oval(self, *coords, **options):
+        return self.add('oval', coords, options)
+
+    def create_text(self, *coords, **options):
+        return self.add('text', coords, options)
+
+    def create_line(self, *coords, **options):
+        return self.add('line', coords, options)
+
+    def create_image(self, *coords, **options):
+        return self.add('image', coords, options)
+
+    def flush(self):
+        """create gathered items on canvas
+        Returns:
+            canvas item id list
+        """
+        commands = self.commands
+        self.commands = []
+        for top in range(0, len(commands), self.batch_size):
+            script = u'list %s' % u' '.join(
+                [u'[%s]' % command
+                 for command in commands[top:top + self.batch_size]])
+            result = self.canvas.tk.eval(script.encode('utf-8'))
+            self.ids.extend(
+                [int(oid) for oid in self.canvas.tk.splitlist(result)])
+        return self.ids
+
+    def get_id(self, handle):
+        """Return canvas item id of handle.
+        Arguments:
+            handle -- value returned by create_*
+        """
+        return self.ids[handle]
+
+
+def test():
+    """open file with batched drawing
+    """
+    from lineinfo import LineInfo
+    from lineinfo import Span
+    from linemap import LineMap
+    from style import Style
+
+    style = Style.load('data/style.xml')
+    infos = LineInfo.load('data/0001.xml')
+
+    line_map = LineMap(batch=True)
+    line_map.draw(infos, style, Span(-1, 0, -1))
+    line_map.mainloop()
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Connection Scan Algorithm over timetables of loaded lines
+"""
+import array
+import bisect
+import heapq
+
+from lineinfo import format_time
+from transferindex import TransferIndex
+
+
+__all__ = ['ConnectionScan']
+
+INFINITY = 1 << 30
+
+
+class Profile(object):
+    """It keeps pareto optimal (departure, arrival) pairs of a stop,
+    departure descending.
+    """
+    __slots__ = ['neg_departures', 'arrivals']
+
+    def __init__(self):
+        self.neg_departures = []
+        self.arrivals = []
+
+    def get_arrival(self, departure):
+        """Return earliest arrival leaving at or after departure.
+        Arguments:
+            departure -- minutes after midnight
+        """
+        pos = bisect.bisect_right(self.neg_departures, -departure) - 1
+        if pos < 0:
+            return INFINITY
+        return self.arrivals[pos]
+
+    def add(self, departure, arrival):
+        """add pair unless dominated, drop pairs it dominates
+        Arguments:
+            departure -- minutes after midnight
+            arrival -- minutes after midnight
+        """
+        neg_departures = self.neg_departures
+        if not neg_departures or -departure > neg_departures[-1]:
+            # earliest departure, as scanning by departure descending
+            if self.arrivals and self.arrivals[-1] <= arrival:
+                return False
+            neg_departures.append(-departure)
+            self.arrivals.append(arrival)
+            return True
+        if self.get_arrival(departure) <= arrival:
+            return False
+        # pairs of same or earlier departure follow pos
+        pos = bisect.bisect_left(neg_departures, -departure)
+        neg_departures.insert(pos, -departure)
+        self.arrivals.insert(pos, arrival)
+        end = pos + 1
+        while end < len(self.arrivals) and self.arrivals[end] >= arrival:
+            end += 1
+        del neg_departures[pos + 1:end]
+        del self.arrivals[pos + 1:end]
+        return True
+
+    def get_pairs(self):
+        """Return (departure, arrival) list, departure ascending.
+        """
+        return [(-neg, arrival) for (neg, arrival)
+                in reversed(zip(self.neg_departures, self.arrivals))]
+
+
+class ConnectionScan(object):
+    """It answers earliest arrival and profile queries.
+
+    Stops are (line position, station idx) of the given line infos and
+    get ids by get_stop_id. Stations joined directly by a resolved change
+    in TransferIndex are transfers taking transfer_minutes.
+    """
+    def __init__(self, line_infos, transfer_minutes=3):
+        """
+        Arguments:
+            line_infos -- LineInfo object list, lines without timetable
+                          only take part in transfers
+            transfer_minutes -- minutes to change lines
+        """
+        self.line_infos = list(line_infos)
+        self.transfer_minutes = transfer_minutes
+        self.stop_ids = {}
+        self.stop_keys = []
+        for (line_pos, line_info) in enumerate(self.line_infos):
+            for station in line_info.stations:
+                self.stop_ids[(line_pos, station.idx)] = len(self.stop_keys)
+                self.stop_keys.append((line_pos, station.idx))
+        self.transfers = self.build_transfers()
+        self.build_connections()
+
+    def build_transfers(self):
+        """Return transfer stop id list of each stop.
+        """
+        index = TransferIndex(self.line_infos)
+        transfers = []
+        for (line_pos, idx) in self.stop_keys:
+            transfers.append([
+                self.stop_ids[(index.positions[id(other)], other_idx)]
+                for (other, other_idx)
+                in index.get_changes(self.line_infos[line_pos], idx)])
+        return transfers
+
+    def build_connections(self):
+        """make connection columns sorted by departure
+        """
+        connections = []
+        self.trips = []
+        # (stop id, stop id) -> shortest ride minutes
+        rides = {}
+        for (line_pos, line_info) in enumerate(self.line_infos):
+            if line_info.timetable is None:
+                continue
+            for trip in line_info.timetable.trips:
+                trip_id = len(self.trips)
+                self.trips.append((line_pos, trip))
+                for (begin, end) in zip(trip.stops, trip.stops[1:]):
+                    dep_stop = self.stop_ids[(line_pos, begin.idx)]
+                    arr_stop = self.stop_ids[(line_pos, end.idx)]
+                    connections.append((
+                        begin.departure,
+                        end.arrival,
+                        dep_stop,
+                        arr_stop,
+                        trip_id,
+                        ))
+                    key = (dep_stop, arr_stop)
+                    minutes = end.arrival - begin.departure
+                    if rides.get(key, INFINITY) > minutes:
+                        rides[key] = minutes
+        connections.sort()
+        self.departures = array.array('i', [con[0] for con in connections])
+        self.arrivals = array.array('i', [con[1] for con in connections])
+        self.departure_stops = array.array(
+            'i', [con[2] for con in connections])
+        self.arrival_stops = array.array('i', [con[3] for con in connections])
+        self.trip_ids = array.array('i', [con[4] for con in connections])
+
+        # (stop id, minutes) lists of rides and transfers, both ways
+        self.next_stops = [[] for stop_id in self.stop_keys]
+        self.prev_stops = [[] for stop_id in self.stop_keys]
+        for ((dep_stop, arr_stop), minutes) in rides.items():
+            self.next_stops[dep_stop].append((arr_stop, minutes))
+            self.prev_stops[arr_stop].append((dep_stop, minutes))
+        for (stop_id, others) in enumerate(self.transfers):
+            for other in others:
+                self.next_stops[stop_id].append(
+                    (other, self.transfer_minutes))
+                self.prev_stops[other].append(
+                    (stop_id, self.transfer_minutes))
+
+    def get_bounds(self, stop_id, edges):
+        """Return least minutes between stop and each stop ignoring
+        waits, INFINITY if not connected.
+        Arguments:
+            stop_id -- stop id
+            edges -- next_stops to go from stop, prev_stops to come to it
+        """
+        bounds = [INFINITY] * len(self.stop_keys)
+        bounds[stop_id] = 0
+        queue = [(0, stop_id)]
+        while queue:
+            (minutes, stop_id) = heapq.heappop(queue)
+            if minutes > bounds[stop_id]:
+                continue
+            for (other, ride) in edges[stop_id]:
+                if minutes + ride < bounds[other]:
+                    bounds[other] = minutes + ride
+                    heapq.heappush(queue, (minutes + ride, other))
+        return bounds
+
+    def __len__(self):
+        return len(self.departures)
+
+    def get_stop_id(self, line_info, idx):
+        """Return stop id of station.
+        Arguments:
+            line_info -- one of line infos given to constructor
+            idx -- station index
+        """
+        while idx < 0:
+            idx += len(line_info.stations)
+        for (line_pos, other) in enumerate(self.line_infos):
+            if other is line_info:
+                return self.stop_ids[(line_pos, idx)]
+        raise KeyError(line_info.line.name)
+
+    def get_station(self, stop_id):
+        """Return (LineInfo, station idx) of stop id.
+        Arguments:
+            stop_id -- stop id
+        """
+        (line_pos, idx) = self.stop_keys[stop_id]
+        return (self.line_infos[line_pos], idx)
+
+    def earliest_arrival(self, source, target, departure):
+        """Return earliest arrival minutes at target, None if unreachable.
+        Arguments:
+            source -- source stop id
+            target -- target stop id
+            departure -- minutes after midnight
+        """
+        arrivals = [INFINITY] * len(self.stop_keys)
+        arrivals[source] = departure
+        for other in self.transfers[source]:
+            arrivals[other] = departure + self.transfer_minutes
+        boarded = bytearray(len(self.trips))
+        transfers = self.transfers
+        transfer_minutes = self.transfer_minutes
+        dep_times = self.departures
+        arr_times = self.arrivals
+        dep_stops = self.departure_stops
+        arr_stops = self.arrival_stops
+        trip_ids = self.trip_ids
+        for pos in xrange(bisect.bisect_left(dep_times, departure),
+                          len(dep_times)):
+            dep_time = dep_times[pos]
+            if dep_time >= arrivals[target]:
+                break
+            trip_id = trip_ids[pos]
+            if not boarded[trip_id]:
+                if arrivals[dep_stops[pos]] > dep_time:
+                    continue
+                boarded[trip_id] = 1
+            arr_stop = arr_stops[pos]
+            arr_time = arr_times[pos]
+            if arr_time < arrivals[arr_stop]:
+                arrivals[arr_stop] = arr_time
+                for other in transfers[arr_stop]:
+                    if arr_time + transfer_minutes < arrivals[other]:
+                        arrivals[other] = arr_time + transfer_minutes
+        if arrivals[target] >= INFINITY:
+            return None
+        return arrivals[target]
+
+    def profile(self, source, target, begin=0, end=INFINITY):
+        """Return pareto optimal (departure, arrival) list from source.
+        Arguments:
+            source -- source stop id
+            target -- target stop id
+            begin -- earliest departure minutes after midnight
+            end -- latest departure minutes after midnight
+        """
+        profiles = [None] * len(self.stop_keys)
+        trip_arrivals = [INFINITY] * len(self.trips)
+        target_transfers = set(self.transfers[target])
+        transfers = self.transfers
+        transfer_minutes = self.transfer_minutes
+        dep_times = self.departures
+        # a journey leaving before end arriving after the earliest arrival
+        # of end is not pareto optimal, so later connections are not used
+        limit = INFINITY
+        # a walk to target is no journey of profile, it does not bound
+        if end < INFINITY and source != target and \
+                source not in target_transfers:
+            arrival = self.earliest_arrival(source, target, end)
+            if arrival is not None:
+                limit = arrival
+        # connections which can not be reached after begin or can not
+        # reach target by limit are skipped
+        from_source = self.get_bounds(source, self.next_stops)
+        to_target = self.get_bounds(target, self.prev_stops)
+        first = bisect.bisect_left(dep_times, begin)
+        last = bisect.bisect_right(dep_times, limit)
+        columns = [column[first:last] for column in [
+            dep_times, self.arrivals, self.departure_stops,
+            self.arrival_stops, self.trip_ids]]
+        for (dep_time, arr_time, dep_stop, arr_stop, trip_id) in \
+                reversed(zip(*columns)):
+            if arr_time + to_target[arr_stop] > limit or \
+                    dep_time < begin + from_source[dep_stop]:
+                continue
+            best = trip_arrivals[trip_id]
+            if arr_stop == target:
+                best = min(best, arr_time)
+            elif arr_stop in target_transfers:
+                best = min(best, arr_time + transfer_minutes)
+            profile = profiles[arr_stop]
+            if profile is not None:
+                best = min(best, profile.get_arrival(arr_time))
+            if best >= INFINITY or best > limit:
+                continue
+            trip_arrivals[trip_id] = best
+            profile = profiles[dep_stop]
+            if profile is None:
+                profile = profiles[dep_stop] = Profile()
+            profile.add(dep_time, best)
+            for other in transfers[dep_stop]:
+                profile = profiles[other]
+                if profile is None:
+                    profile = profiles[other] = Profile()
+                profile.add(dep_time - transfer_minutes, best)
+        profile = profiles[source]
+        if profile is None:
+            return []
+        return [(dep, arr) for (dep, arr) in profile.get_pairs()
+                if begin <= dep <= end]
+
+
+def test():
+    """earliest arrivals over generated metro timetables
+    """
+    import time
+    from lineinfo import LineInfo
+    from lineinfo import Timetable
+    from lineinfo import gen_line_files
+
+    infos = [LineInfo.load(filename) for filename in gen_line_files('data')]
+    for info in infos:
+        info.timetable = Timetable.from_headway(info, 5 * 60, 24 * 60, 4)
+    start = time.time()
+    engine = ConnectionScan(infos)
+    print '%d connections built in %.1f ms' % (
+        len(engine), (time.time() - start) * 1000)
+
+    source = engine.get_stop_id(infos[0], 0)
+    target = engine.get_stop_id(infos[-1], len(infos[-1].stations) // 2)
+    for departure in [6 * 60, 8 * 60 + 30, 17 * 60 + 45]:
+        start = time.time()
+        arrival = engine.earliest_arrival(source, target, departure)
+        elapsed = (time.time() - start) * 1000
+        print (u'%s -> %s  %s  %.2f ms' % (
+            format_time(departure),
+            arrival is not None and format_time(arrival) or u'-',
+            engine.get_station(target)[0].get_station_name(
+                engine.get_station(target)[1]),
+            elapsed)).encode('utf-8')
+    start = time.time()
+    pairs = engine.profile(source, target, 8 * 60, 9 * 60)
+    print 'profile 08:00-09:00 %d journeys %.2f ms' % (
+        len(pairs), (time.time() - start) * 1000)
+
+
+if __name__ == '__main__':
+    test()
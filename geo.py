@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Great circle distance of positions in degrees
+"""
+import math
+
+
+__all__ = ['EARTH_RADIUS', 'haversine']
+
+EARTH_RADIUS = 6371.0
+
+
+def haversine(lat1, long1, lat2, long2, lib=math):
+    """Return great circle kilometers between positions.
+    Arguments:
+        lat1 -- latitude of first position in degrees
+        long1 -- longitude of first position in degrees
+        lat2 -- latitude of second position in degrees
+        long2 -- longitude of second position in degrees
+        lib -- math for numbers, numpy for arrays
+    """
+    (lat1, long1, lat2, long2) = [lib.radians(value) for value in
+                                  (lat1, long1, lat2, long2)]
+    value = (lib.sin((lat2 - lat1) / 2) ** 2 +
+             lib.cos(lat1) * lib.cos(lat2) *
+             lib.sin((long2 - long1) / 2) ** 2)
+    arcsin = getattr(lib, 'arcsin', None) or lib.asin
+    return 2 * EARTH_RADIUS * arcsin(lib.sqrt(value))
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Geographic Map
+"""
+import math
+
+import Tkinter as Tk
+
+from lineinfo import LineInfo
+from style import Style
+
+
+__all__ = ['GeoMap', 'SpatialGrid']
+
+# pixels per projected degree from which minor stations are drawn
+MINOR_SCALE = 4000
+# pixels per projected degree from which station names are drawn
+LABEL_SCALE = 12000
+
+
+def project(latlong):
+    """Return mercator (x, y) of LatLong in degrees, y grows southward.
+    Arguments:
+        latlong -- LatLong object
+    """
+    latitude = max(-85.0, min(85.0, latlong.latitude))
+    return (
+        latlong.longitude,
+        -math.degrees(math.log(math.tan(
+            math.pi / 4 + math.radians(latitude) / 2))),
+        )
+
+
+class SpatialGrid(object):
+    """It keeps items in fixed size cells for rectangle queries.
+    """
+    def __init__(self, cell_size):
+        """
+        Arguments:
+            cell_size -- cell width and height
+        """
+        self.cell_size = float(cell_size)
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def gen_cells(self, left, top, right, bottom):
+        size = self.cell_size
+        for col in range(int(math.floor(left / size)),
+                         int(math.floor(right / size)) + 1):
+            for row in range(int(math.floor(top / size)),
+                             int(math.floor(bottom / size)) + 1):
+                yield (col, row)
+
+    def insert(self, item, left, top, right=None, bottom=None):
+        """
+        Arguments:
+            item -- stored item
+            left, top, right, bottom -- bounding box, point if no right
+        """
+        if right is None:
+            (right, bottom) = (left, top)
+        for cell in self.gen_cells(left, top, right, bottom):
+            self.cells.setdefault(cell, []).append(item)
+
+    def query(self, left, top, right, bottom):
+        """Return items in cells which intersect rectangle.
+        Arguments:
+            left, top, right, bottom -- rectangle
+        """
+        size = self.cell_size
+        area = ((math.floor(right / size) - math.floor(left / size) + 1) *
+                (math.floor(bottom / size) - math.floor(top / size) + 1))
+        if area > len(self.cells):
+            # zoomed out, filled cells are fewer than cells in rectangle
+            col_range = (math.floor(left / size), math.floor(right / size))
+            row_range = (math.floor(top / size), math.floor(bottom / size))
+            cells = [cell for cell in self.cells
+                     if col_range[0] <= cell[0] <= col_range[1] and
+                     row_range[0] <= cell[1] <= row_range[1]]
+        else:
+            cells = self.gen_cells(left, top, right, bottom)
+        found = []
+        seen = set()
+        for cell in cells:
+            for item in self.cells.get(cell, ()):
+                if id(item) not in seen:
+                    seen.add(id(item))
+                    found.append(item)
+        return found
+
+
+class GeoNode(object):
+    """It keeps projected station.
+    """
+    __slots__ = ['line_info', 'station', 'x', 'y', 'major']
+
+    def __init__(self, line_info, station, x, y, major):
+        self.line_info = line_info
+        self.station = station
+        self.x = x
+        self.y = y
+        self.major = major
+
+
+class GeoSegment(object):
+    """It keeps projected link between two nodes.
+    """
+    __slots__ = ['color', 'begin', 'end']
+
+    def __init__(self, color, begin, end):
+        self.color = color
+        self.begin = begin
+        self.end = end
+
+
+class GeoMap(Tk.Frame):
+    """Geographic map widget
+    """
+    def __init__(self, master=None, view_size=(640, 480), style=None):
+        """
+        Arguments:
+            master -- parent widget
+            view_size -- view width, view height
+            style -- decoration info
+        """
+        Tk.Frame.__init__(self, master)
+        self.pack()
+
+        self.view_size = view_size
+        self.style = style
+        (view_width, view_height) = view_size
+        self.view = Tk.Canvas(self,
+                              borderwidth=2,
+                              background='#fff',
+                              width=view_width,
+                              height=view_height)
+        self.view.grid(row=0, column=0)
+        self.view.bind('<ButtonPress-1>', self.on_press)
+        self.view.bind('<B1-Motion>', self.on_drag)
+        self.view.bind('<ButtonRelease-1>', self.on_release)
+        self.view.bind('<MouseWheel>', self.on_wheel)
+        self.view.bind('<Button-4>', self.on_wheel)
+        self.view.bind('<Button-5>', self.on_wheel)
+
+        self.line_infos = []
+        self.nodes = []
+        self.node_grid = None
+        self.segment_grids = None
+        # world position at canvas top left and pixels per degree
+        self.origin = (0.0, 0.0)
+        self.scale = 1.0
+        self.drag_from = None
+        self.drag_moved = (0, 0)
+
+    def set_lines(self, line_infos):
+        """project stations and build grids
+        Arguments:
+            line_infos -- LineInfo object list
+        """
+        self.line_infos = list(line_infos)
+        nodes = []
+        # segments for minor level and major level
+        segments = ([], [])
+        for line_info in self.line_infos:
+            line_nodes = {}
+            for station in line_info.get_stations():
+                latlong = station.latlong
+                if not latlong.latitude and not latlong.longitude:
+                    continue
+                (pos_x, pos_y) = project(latlong)
+                summary = line_info.get_change_summary(station.idx)
+                major = bool(summary.mark_changes or summary.text_changes)
+                line_nodes[station.idx] = GeoNode(line_info, station,
+                                                  pos_x, pos_y, major)
+            if line_nodes:
+                first = min(line_nodes)
+                last = max(line_nodes)
+                line_nodes[first].major = True
+                line_nodes[last].major = True
+            nodes.extend(line_nodes.values())
+            color = line_info.line.color
+            major_begin = None
+            for link in line_info.links:
+                begin = line_nodes.get(link.begin_idx)
+                end = line_nodes.get(link.end_idx)
+                if begin is None or end is None:
+                    continue
+                segments[0].append(GeoSegment(color, begin, end))
+                if major_begin is None:
+                    major_begin = begin
+                if end.major:
+                    segments[1].append(GeoSegment(color, major_begin, end))
+                    major_begin = end
+
+        self.nodes = nodes
+        if not nodes:
+            self.node_grid = None
+            self.segment_grids = None
+            self.view.delete('all')
+            return
+        left = min([node.x for node in nodes])
+        right = max([node.x for node in nodes])
+        top = min([node.y for node in nodes])
+        bottom = max([node.y for node in nodes])
+        cell_size = max(right - left, bottom - top, 1e-6) / 64
+        self.node_grid = SpatialGrid(cell_size)
+        for node in nodes:
+            self.node_grid.insert(node, node.x, node.y)
+        self.segment_grids = []
+        for level_segments in segments:
+            grid = SpatialGrid(cell_size)
+            for segment in level_segments:
+                grid.insert(segment,
+                            min(segment.begin.x, segment.end.x),
+                            min(segment.begin.y, segment.end.y),
+                            max(segment.begin.x, segment.end.x),
+                            max(segment.begin.y, segment.end.y))
+            self.segment_grids.append(grid)
+        self.fit(left, top, right, bottom)
+
+    def fit(self, left, top, right, bottom):
+        """show rectangle in view
+        Arguments:
+            left, top, right, bottom -- rectangle in world
+        """
+        (view_width, view_height) = self.view_size
+        self.scale = min(view_width / max(right - left, 1e-6),
+                         view_height / max(bottom - top, 1e-6)) * 0.9
+        self.origin = (
+            (left + right) / 2 - view_width / 2.0 / self.scale,
+            (top + bottom) / 2 - view_height / 2.0 / self.scale,
+            )
+        self.redraw()
+
+    def to_view(self, pos_x, pos_y):
+        return ((pos_x - self.origin[0]) * self.scale,
+                (pos_y - self.origin[1]) * self.scale)
+
+    def to_world(self, view_x, view_y):
+        return (view_x / self.scale + self.origin[0],
+                view_y / self.scale + self.origin[1])
+
+    def get_viewport(self):
+        """Return world rectangle shown in view.
+        """
+        (view_width, view_height) = self.view_size
+        (left, top) = self.to_world(0, 0)
+        (right, bottom) = self.to_world(view_width, view_height)
+        return (left, top, right, bottom)
+
+    def redraw(self):
+        """draw items in viewport at current level of detail
+        """
+        self.view.delete('all')
+        self.drag_moved = (0, 0)
+        if self.node_grid is None:
+            return
+        viewport = self.get_viewport()
+        show_minor = self.scale >= MINOR_SCALE
+        show_label = self.scale >= LABEL_SCALE
+        style = self.style
+        width = 3
+        radius = 4
+        font = None
+        if style is not None:
+            width = max(1, min(style.link.width, int(self.scale / 2000)))
+            radius = max(2, min(style.change.mark.radius,
+                                int(self.scale / 2000)))
+            font = (style.station.text.font.family,
+                    style.station.text.font.size)
+
+        grid = self.segment_grids[show_minor and 0 or 1]
+        for segment in grid.query(*viewport):
+            self.view.create_line(
+                self.to_view(segment.begin.x, segment.begin.y),
+                self.to_view(segment.end.x, segment.end.y),
+                fill=segment.color,
+                width=width)
+        for node in self.node_grid.query(*viewport):
+            if not node.major and not show_minor:
+                continue
+            (view_x, view_y) = self.to_view(node.x, node.y)
+            self.view.create_oval(view_x - radius, view_y - radius,
+                                  view_x + radius, view_y + radius,
+                                  outline=node.line_info.line.color,
+                                  fill='#fff')
+            if show_label:
+                self.view.create_text(view_x + radius + 2, view_y,
+                                      anchor=Tk.W,
+                                      font=font,
+                                      text=node.station.name)
+
+    def zoom(self, factor, view_x, view_y):
+        """
+        Arguments:
+            factor -- scale factor
+            view_x, view_y -- fixed point in view
+        """
+        (pos_x, pos_y) = self.to_world(view_x, view_y)
+        self.scale *= factor
+        self.origin = (pos_x - view_x / self.scale,
+                       pos_y - view_y / self.scale)
+        self.redraw()
+
+    def on_press(self, event):
+        self.drag_from = (event.x, event.y)
+
+    def on_drag(self, event):
+        if self.drag_from is None:
+            return
+        (delta_x, delta_y) = (event.x - self.drag_from[0],
+                              event.y - self.drag_from[1])
+        self.drag_from = (event.x, event.y)
+        # move existing items, culling is redone on release
+        self.view.move('all', delta_x, delta_y)
+        self.drag_moved = (self.drag_moved[0] + delta_x,
+                           self.drag_moved[1] + delta_y)
+
+    def on_release(self, event):
+        self.drag_from = None
+        (delta_x, delta_y) = self.drag_moved
+        if delta_x or delta_y:
+            self.origin = (self.origin[0] - delta_x / self.scale,
+                           self.origin[1] - delta_y / self.scale)
+            self.redraw()
+
+    def on_wheel(self, event):
+        if event.num == 5 or event.delta < 0:
+            factor = 1 / 1.25
+        else:
+            factor = 1.25
+        self.zoom(factor, event.x, event.y)
+
+
+def test():
+    """open all files
+    """
+    import glob
+
+    style = Style.load('data/style.xml')
+    infos = [LineInfo.load(filename)
+             for filename in sorted(glob.glob('data/0*.xml'))]
+
+    geo_map = GeoMap(style=style)
+    geo_map.set_lines(infos)
+    geo_map.mainloop()
+
+
+if __name__ == '__main__':
+    test()
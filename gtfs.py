@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Streaming GTFS feed importer making LineInfo of each route
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+
+from geo import haversine
+from lineinfo import Change
+from lineinfo import LatLong
+from lineinfo import Line
+from lineinfo import LineInfo
+from lineinfo import Link
+from lineinfo import Station
+
+
+__all__ = ['GtfsImporter']
+
+# transfer_type of transfers.txt meaning no transfer
+NO_TRANSFER = u'3'
+
+
+def distance(latlong1, latlong2):
+    """Return great circle kilometers between LatLong objects.
+    """
+    return haversine(latlong1.latitude, latlong1.longitude,
+                     latlong2.latitude, latlong2.longitude)
+
+
+def parse_seconds(text):
+    """Return seconds of 'H:MM:SS', None if empty. Hours may pass 24.
+    """
+    if not text:
+        return None
+    (hours, minutes, seconds) = text.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+class Histogram(object):
+    """It counts values for median, memory is bound by distinct values.
+    """
+    __slots__ = ['counts', 'total']
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+
+    def add(self, value):
+        self.counts[value] = self.counts.get(value, 0) + 1
+        self.total += 1
+
+    def median(self):
+        """Return lower median, None if empty.
+        """
+        remaining = (self.total + 1) // 2
+        for value in sorted(self.counts):
+            remaining -= self.counts[value]
+            if remaining <= 0:
+                return value
+        return None
+
+
+class GtfsImporter(object):
+    """It reads a GTFS feed directory.
+
+    stop_times.txt is streamed once and is expected grouped by trip_id
+    as feeds are written; only trip patterns and minute histograms of
+    links are kept, so memory does not grow with its rows.
+    """
+    def __init__(self, dirname):
+        """
+        Arguments:
+            dirname -- directory of stops.txt, routes.txt, trips.txt,
+                       stop_times.txt and optional transfers.txt
+        """
+        self.dirname = dirname
+        self.rows = 0
+        self.seconds = 0.0
+        # stop id -> (name, LatLong, code, station id)
+        self.stops = {}
+        self.routes = {}
+        # trip id -> (route id, direction id)
+        self.trips = {}
+        # route id -> {(direction id, stop id tuple): number of trips}
+        self.patterns = {}
+        # (route id, stop id, stop id) -> Histogram of minutes
+        self.histograms = {}
+        # route id of each LineInfo returned by run
+        self.route_ids = []
+
+    def gen_rows(self, name, keys):
+        """value tuple generator of csv file, values are unicode
+        Arguments:
+            name -- file name in feed
+            keys -- column names, missing columns give empty values
+        """
+        path = os.path.join(self.dirname, name)
+        with open(path, 'rb') as csv_file:
+            reader = csv.reader(csv_file)
+            header = next(reader, None)
+            if header is None:
+                return
+            if header[0].startswith('\xef\xbb\xbf'):
+                header[0] = header[0][3:]
+            header = [key.strip() for key in header]
+            # missing column reads the empty value appended to each row
+            positions = []
+            for key in keys:
+                if key in header:
+                    positions.append(header.index(key))
+                else:
+                    positions.append(-1)
+            for values in reader:
+                self.rows += 1
+                values.append('')
+                yield tuple([values[pos].decode('utf-8')
+                             for pos in positions])
+
+    def read_stops(self):
+        for (stop_id, name, latitude, longitude, code, parent) in \
+                self.gen_rows('stops.txt', [
+                    'stop_id', 'stop_name', 'stop_lat', 'stop_lon',
+                    'stop_code', 'parent_station']):
+            self.stops[stop_id] = (name, LatLong(latitude, longitude),
+                                   code or stop_id, parent or stop_id)
+
+    def read_routes(self):
+        for (route_id, short_name, long_name, color) in self.gen_rows(
+                'routes.txt', ['route_id', 'route_short_name',
+                               'route_long_name', 'route_color']):
+            self.routes[route_id] = Line(
+                long_name or short_name or route_id,
+                u'#' + (color.lstrip(u'#') or u'888888').lower(),
+                short_name or route_id,
+                )
+
+    def read_trips(self):
+        for (trip_id, route_id, direction) in self.gen_rows(
+                'trips.txt', ['trip_id', 'route_id', 'direction_id']):
+            self.trips[trip_id] = (route_id, direction or u'0')
+
+    def add_trip(self, trip_id, stop_times):
+        """count pattern and link minutes of a trip
+        Arguments:
+            trip_id -- trip id
+            stop_times -- (stop_sequence, stop id, arrival, departure) list
+        """
+        found = self.trips.get(trip_id)
+        if found is None or len(stop_times) < 2:
+            return
+        (route_id, direction) = found
+        stop_times.sort()
+        pattern = tuple([stop_id for (sequence, stop_id, arrival, departure)
+                         in stop_times])
+        patterns = self.patterns.setdefault(route_id, {})
+        key = (direction, pattern)
+        patterns[key] = patterns.get(key, 0) + 1
+        for (begin, end) in zip(stop_times, stop_times[1:]):
+            departure = begin[3] is not None and begin[3] or begin[2]
+            arrival = end[2] is not None and end[2] or end[3]
+            if departure is None or arrival is None:
+                continue
+            key = (route_id, begin[1], end[1])
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[key] = histogram
+            histogram.add(int(round((arrival - departure) / 60.0)))
+
+    def read_stop_times(self):
+        trip_id = None
+        stop_times = []
+        for (row_trip_id, sequence, stop_id, arrival, departure) in \
+                self.gen_rows('stop_times.txt', [
+                    'trip_id', 'stop_sequence', 'stop_id', 'arrival_time',
+                    'departure_time']):
+            if row_trip_id != trip_id:
+                self.add_trip(trip_id, stop_times)
+                trip_id = row_trip_id
+                stop_times = []
+            stop_times.append((int(sequence), stop_id,
+                               parse_seconds(arrival),
+                               parse_seconds(departure)))
+        self.add_trip(trip_id, stop_times)
+
+    def read_transfers(self):
+        """Return {station id: set of station ids} of transfers.txt.
+        """
+        transfers = {}
+        if not os.path.exists(os.path.join(self.dirname, 'transfers.txt')):
+            return transfers
+        for (begin, end, transfer_type) in self.gen_rows(
+                'transfers.txt', ['from_stop_id', 'to_stop_id',
+                                  'transfer_type']):
+            if transfer_type == NO_TRANSFER:
+                continue
+            begin = self.stops.get(begin)
+            end = self.stops.get(end)
+            if begin is None or end is None or begin[3] == end[3]:
+                continue
+            # a change is shown on both lines
+            transfers.setdefault(begin[3], set()).add(end[3])
+            transfers.setdefault(end[3], set()).add(begin[3])
+        return transfers
+
+    def get_pattern(self, route_id):
+        """Return stop id tuple of route, direction 0 with most trips first.
+        Arguments:
+            route_id -- route id
+        """
+        patterns = self.patterns.get(route_id)
+        if not patterns:
+            return ()
+        ((direction, pattern), count) = max(
+            patterns.items(),
+            key=lambda item: (item[0][0] == u'0', item[1], len(item[0][1])))
+        return pattern
+
+    def get_minutes(self, route_id, begin, end):
+        """Return median minutes between stops, either way.
+        """
+        for key in [(route_id, begin, end), (route_id, end, begin)]:
+            histogram = self.histograms.get(key)
+            if histogram is not None:
+                return histogram.median()
+        return 0
+
+    def build(self):
+        """Return LineInfo list, one per route having trips, route ids
+        are kept in route_ids.
+        """
+        transfers = self.read_transfers()
+        patterns = {}
+        # station id -> [(route id, idx)]
+        serving = {}
+        for route_id in sorted(self.routes):
+            pattern = self.get_pattern(route_id)
+            if not pattern:
+                continue
+            patterns[route_id] = pattern
+            for (idx, stop_id) in enumerate(pattern):
+                station_id = self.stops[stop_id][3]
+                serving.setdefault(station_id, []).append((route_id, idx))
+
+        line_infos = []
+        self.route_ids = []
+        for route_id in sorted(patterns):
+            pattern = patterns[route_id]
+            stations = []
+            for (idx, stop_id) in enumerate(pattern):
+                (name, latlong, code, station_id) = self.stops[stop_id]
+                stations.append(Station(idx, name, latlong, code))
+            links = []
+            for idx in range(len(pattern) - 1):
+                links.append(Link(
+                    idx, idx + 1,
+                    round(distance(stations[idx].latlong,
+                                   stations[idx + 1].latlong), 1),
+                    self.get_minutes(route_id, pattern[idx],
+                                     pattern[idx + 1])))
+            changes = []
+            for (idx, stop_id) in enumerate(pattern):
+                station_id = self.stops[stop_id][3]
+                others = list(serving.get(station_id, []))
+                for other_station in sorted(transfers.get(station_id, ())):
+                    others.extend(serving.get(other_station, []))
+                seen = set([route_id])
+                for (other_id, other_idx) in others:
+                    if other_id in seen:
+                        continue
+                    seen.add(other_id)
+                    (name, latlong, code, other_station) = \
+                        self.stops[patterns[other_id][other_idx]]
+                    changes.append(Change(
+                        idx, self.routes[other_id],
+                        Station(-1, name, LatLong(0.0, 0.0), code)))
+            line_infos.append(LineInfo(self.routes[route_id], stations,
+                                       links, changes))
+            self.route_ids.append(route_id)
+        return line_infos
+
+    def run(self):
+        """read feed and return LineInfo list
+        """
+        start = time.time()
+        self.rows = 0
+        self.read_stops()
+        self.read_routes()
+        self.read_trips()
+        self.read_stop_times()
+        line_infos = self.build()
+        self.seconds = time.time() - start
+        return line_infos
+
+    def get_rate(self):
+        """Return rows per second of last run.
+        """
+        return self.rows / max(self.seconds, 1e-6)
+
+
+def get_filename(route_id, used):
+    """Return line file name of route id, suffixed if already used.
+    Arguments:
+        route_id -- route id
+        used -- set of lower case file names used so far, name is added
+    """
+    base = re.sub(r'[^-\w.]', '_', route_id, flags=re.UNICODE)
+    filename = base + u'.xml'
+    count = 1
+    # file systems may ignore case
+    while filename.lower() in used:
+        count += 1
+        filename = u'%s-%d.xml' % (base, count)
+    used.add(filename.lower())
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='import GTFS feed into line files')
+    parser.add_argument('feed', help='directory of GTFS txt files')
+    parser.add_argument('output', help='directory of line files')
+    args = parser.parse_args()
+
+    importer = GtfsImporter(args.feed)
+    line_infos = importer.run()
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    used = set()
+    for (route_id, line_info) in zip(importer.route_ids, line_infos):
+        filename = get_filename(route_id, used)
+        if not os.path.supports_unicode_filenames:
+            filename = filename.encode('utf-8')
+        line_info.save(os.path.join(args.output, filename))
+    sys.stderr.write('%d lines, %d rows in %.2f s: %.0f rows/s\n' % (
+        len(line_infos), importer.rows, importer.seconds,
+        importer.get_rate()))
+
+
+if __name__ == '__main__':
+    main()
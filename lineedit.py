@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""FenwickTree, EditableLineInfo
+"""
+from lineinfo import LineInfo
+from lineinfo import Link
+
+
+__all__ = ['FenwickTree', 'EditableLineInfo']
+
+
+class FenwickTree(object):
+    """It keeps prefix sums with O(log n) update and query.
+    """
+    __slots__ = ['tree']
+
+    def __init__(self, values):
+        """
+        Arguments:
+            values -- initial value list
+        """
+        size = len(values)
+        self.tree = [0] + list(values)
+        for pos in range(1, size + 1):
+            parent = pos + (pos & -pos)
+            if parent <= size:
+                self.tree[parent] += self.tree[pos]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, idx, delta):
+        """add delta to value at idx
+        Arguments:
+            idx -- value index
+            delta -- difference
+        """
+        pos = idx + 1
+        while pos < len(self.tree):
+            self.tree[pos] += delta
+            pos += pos & -pos
+
+    def prefix(self, idx):
+        """Return sum of values before idx.
+        Arguments:
+            idx -- value index
+        """
+        total = 0
+        pos = idx
+        while pos > 0:
+            total += self.tree[pos]
+            pos -= pos & -pos
+        return total
+
+    def get_range(self, begin_idx, end_idx):
+        """Return sum of values in [begin_idx, end_idx).
+        Arguments:
+            begin_idx -- first value index
+            end_idx -- value index after last
+        """
+        return self.prefix(end_idx) - self.prefix(begin_idx)
+
+
+class EditableLineInfo(LineInfo):
+    """It keeps line info whose link minutes and kilometers are edited.
+
+    Link values are kept in FenwickTree indexed by link begin index, so
+    updating a link and getting minutes or kilometers of any span are
+    O(log n). Links are expected in station order as in line files.
+    """
+    __slots__ = ['minute_tree', 'kilometer_tree', 'positions', 'listeners']
+
+    def __init__(self, line, stations, links, changes, timetable=None):
+        LineInfo.__init__(self, line, stations, links, changes, timetable)
+        size = self.get_size()
+        minutes = [0] * size
+        kilometers = [0.0] * size
+        self.positions = {}
+        for (pos, link) in enumerate(links):
+            minutes[link.begin_idx] += link.minutes
+            kilometers[link.begin_idx] += link.kilometers
+            self.positions[link.begin_idx] = pos
+        self.minute_tree = FenwickTree(minutes)
+        self.kilometer_tree = FenwickTree(kilometers)
+        self.listeners = []
+
+    @classmethod
+    def copy(cls, line_info):
+        """make editable line info from line info
+        Arguments:
+            line_info -- LineInfo object
+        """
+        return cls(line_info.line,
+                   list(line_info.stations),
+                   [Link(link.begin_idx, link.end_idx,
+                         link.kilometers, link.minutes)
+                    for link in line_info.links],
+                   list(line_info.changes),
+                   line_info.timetable)
+
+    def add_listener(self, callback):
+        """call callback(line_info, link) when link changed
+        Arguments:
+            callback -- function
+        """
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """
+        Arguments:
+            callback -- function given to add_listener
+        """
+        self.listeners.remove(callback)
+
+    def get_link(self, begin_idx):
+        """Return link which begins at station.
+        Arguments:
+            begin_idx -- begin station index
+        """
+        while begin_idx < 0:
+            begin_idx += len(self.stations)
+        return self.links[self.positions[begin_idx]]
+
+    def set_link(self, begin_idx, minutes=None, kilometers=None):
+        """change link values and notify listeners
+        Arguments:
+            begin_idx -- begin station index
+            minutes -- new minutes, None keeps value
+            kilometers -- new kilometers, None keeps value
+        """
+        link = self.get_link(begin_idx)
+        if minutes is not None:
+            minutes = int(minutes)
+            self.minute_tree.add(link.begin_idx, minutes - link.minutes)
+            link.minutes = minutes
+        if kilometers is not None:
+            kilometers = float(kilometers)
+            self.kilometer_tree.add(link.begin_idx,
+                                    kilometers - link.kilometers)
+            link.kilometers = kilometers
+        for callback in list(self.listeners):
+            callback(self, link)
+
+    def get_span_sum(self, tree, begin_idx, end_idx):
+        while begin_idx < 0:
+            begin_idx += len(self.stations)
+        while end_idx < 0:
+            end_idx += len(self.stations)
+        if begin_idx > end_idx:
+            (begin_idx, end_idx) = (end_idx, begin_idx)
+        return tree.get_range(begin_idx, end_idx)
+
+    def get_minutes(self, begin_idx, end_idx, base_minutes=0):
+        """
+        Arguments:
+            begin_idx -- begin station index
+            end_idx -- end station index
+            base_minutes -- base minutes
+        """
+        return self.get_span_sum(
+            self.minute_tree, begin_idx, end_idx) - base_minutes
+
+    def get_kilometers(self, begin_idx, end_idx, base_kilometers=0):
+        """
+        Arguments:
+            begin_idx -- begin station index
+            end_idx -- end station index
+            base_kilometers -- base kilometers
+        """
+        return self.get_span_sum(
+            self.kilometer_tree, begin_idx, end_idx) - base_kilometers
+
+
+def test():
+    """edit link on line map
+    """
+    from lineinfo import Span
+    from linemap import LineMap
+    from style import Style
+
+    style = Style.load('data/style.xml')
+    infos = EditableLineInfo.load('data/0001.xml')
+
+    line_map = LineMap()
+    line_map.draw(infos, style, Span(-1, 0, -1))
+    infos.add_listener(line_map.on_link_changed)
+
+    def tick():
+        link = infos.get_link(5)
+        infos.set_link(5, minutes=link.minutes % 9 + 1)
+        line_map.after(200, tick)
+    tick()
+    line_map.mainloop()
+
+
+if __name__ == '__main__':
+    test()
@@ -2,9 +2,11 @@
 # -*- coding: utf-8 -*-
 """LatLong, Station, Link, Line, LineInfo
 """
-import xml.dom.minidom
+import glob
+import os
+import weakref
 
-__all__ = ['LineInfo', 'Span']
+__all__ = ['LineInfo', 'Span', 'Interner', 'Timetable', 'gen_line_files']
 
 
 def getChildren(element, path):
@@ -34,6 +36,55 @@ def getTextValue(element, path, default=''):
     return child.firstChild.data
 
 
+class RootFound(Exception):
+    pass
+
+
+def get_root_name(xml_file, size=1024):
+    """Return name of root element, None if file is not xml. Only bytes
+    up to the root start tag are parsed.
+    Arguments:
+        xml_file -- file object of xml
+        size -- bytes read at once
+    """
+    from xml.parsers import expat
+
+    def start_element(name, attrs):
+        raise RootFound(name)
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    try:
+        while True:
+            data = xml_file.read(size)
+            parser.Parse(data, not data)
+            if not data:
+                return None
+    except RootFound as found:
+        return found.args[0]
+    except expat.ExpatError:
+        return None
+
+
+def gen_line_files(dirname):
+    """line file name generator, files without line-info are skipped
+    Arguments:
+        dirname -- directory name
+    """
+    import xmlsource
+    filenames = glob.glob(os.path.join(dirname, '*.xml'))
+    for suffix in xmlsource.SUFFIXES:
+        filenames.extend(glob.glob(os.path.join(dirname, '*.xml' + suffix)))
+    for filename in sorted(filenames):
+        with open(filename, 'rb') as raw_file:
+            try:
+                name = get_root_name(xmlsource.open_xml(raw_file))
+            except IOError:
+                continue
+        if name == 'line-info':
+            yield filename
+
+
 class Span(object):
     """It keeps span.
     """
@@ -54,7 +105,7 @@ class Span(object):
 class LatLong(object):
     """It keeps position.
     """
-    __slots__ = ['latitude', 'longitude']
+    __slots__ = ['latitude', 'longitude', '__weakref__']
 
     def __init__(self, latitude, longitude):
         """
@@ -83,11 +134,17 @@ class LatLong(object):
             )
 
     @classmethod
-    def parse(cls, element):
+    def parse(cls, element, interner=None):
         """create latlong from xml element
         Attributes:
             element -- station element
+            interner -- Interner object
         """
+        if interner is not None:
+            return interner.latlong(
+                element.getAttribute('latitude'),
+                element.getAttribute('longitude'),
+                )
         return LatLong(
             element.getAttribute('latitude'),
             element.getAttribute('longitude'),
@@ -97,17 +154,17 @@ class LatLong(object):
 class Station(object):
     """It keeps station info.
     """
-    __slots__ = ['idx', 'name', 'latlong', 'code']
+    __slots__ = ['idx', 'name', 'latlong', 'code', '__weakref__']
 
     def __init__(self, idx, name, latlong, code):
         """
         Arguments:
-            idx -- index
+            idx -- index, None or empty string if missing
             name -- station name
             latlong -- LatLong object
             code -- station code
         """
-        if not idx:
+        if idx is None or idx == '':
             idx = -1
         self.idx = int(idx)
         self.name = name
@@ -156,13 +213,21 @@ class Station(object):
         return False
 
     @classmethod
-    def parse(cls, el_station):
+    def parse(cls, el_station, interner=None):
         """create station from xml element
         Arguments:
             el_station -- element
+            interner -- Interner object
         Returns:
             Station object.
         """
+        if interner is not None:
+            return interner.station(
+                el_station.getAttribute('idx'),
+                el_station.getAttribute('name'),
+                LatLong.parse(el_station, interner),
+                el_station.getAttribute('code'),
+                )
         return Station(
             el_station.getAttribute('idx'),
             el_station.getAttribute('name'),
@@ -231,7 +296,7 @@ class Link(object):
 class Line(object):
     """It keeps line.
     """
-    __slots__ = ['name', 'color', 'code']
+    __slots__ = ['name', 'color', 'code', '__weakref__']
 
     def __init__(self, name, color, code):
         self.name = name
@@ -266,11 +331,18 @@ class Line(object):
         return False
 
     @classmethod
-    def parse(cls, el_line):
+    def parse(cls, el_line, interner=None):
         """make line from xml element
         Arguments:
             el_line -- element
+            interner -- Interner object
         """
+        if interner is not None:
+            return interner.line(
+                el_line.getAttribute('name'),
+                el_line.getAttribute('color'),
+                el_line.getAttribute('code'),
+                )
         return Line(
             el_line.getAttribute('name'),
             el_line.getAttribute('color'),
@@ -322,28 +394,317 @@ class Change(object):
         return False
 
     @classmethod
-    def parse(cls, el_change):
+    def parse(cls, el_change, interner=None):
         """make change from xml element
         Arguments:
             el_change -- element
+            interner -- Interner object
         """
         return Change(
             el_change.getAttribute('idx'),
-            Line.parse(getChild(el_change, 'line')),
-            Station.parse(getChild(el_change, 'station')),
+            Line.parse(getChild(el_change, 'line'), interner),
+            Station.parse(getChild(el_change, 'station'), interner),
+            )
+
+
+class ChangeSummary(object):
+    """It keeps changes of a station split into marks and text.
+    """
+    __slots__ = ['idx', 'mark_changes', 'text_changes', 'text', 'heights']
+
+    def __init__(self, idx, changes):
+        """
+        Arguments:
+            idx -- station index
+            changes -- Change object list
+        """
+        self.idx = idx
+        self.mark_changes = tuple(
+            [change for change in changes if change.line.has_code()])
+        self.text_changes = tuple(
+            [change for change in changes if not change.line.has_code()])
+        self.text = u', '.join(
+            [change.line.name for change in self.text_changes])
+        self.heights = {}
+
+    def __repr__(self):
+        return u"%s(%d, %s)" % (
+            self.__class__.__name__,
+            self.idx,
+            list(self.mark_changes + self.text_changes).__repr__(),
+            )
+
+    def get_height(self, style):
+        """Return height of changes drawn with style.
+        Arguments:
+            style -- decoration info
+        """
+        key = (style.change.mark.radius, style.change.text.height)
+        height = self.heights.get(key)
+        if height is None:
+            height = 0
+            if self.mark_changes:
+                height += style.change.mark.radius * 2
+            if self.text_changes:
+                height += style.change.text.height
+            self.heights[key] = height
+        return height
+
+
+class Interner(object):
+    """It keeps shared Line, Station objects and strings.
+
+    Objects are weakly referenced, so they are dropped with the last
+    LineInfo using them. Unicode can not be weakly referenced; when the
+    string table has doubled since the last prune, it is rebuilt from
+    the shared objects still alive.
+    """
+    def __init__(self):
+        self.strings = {}
+        self.prune_size = 1024
+        self.latlongs = weakref.WeakValueDictionary()
+        self.lines = weakref.WeakValueDictionary()
+        self.stations = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.lines) + len(self.stations)
+
+    def string(self, value):
+        """Return shared string equal to value.
+        Arguments:
+            value -- string
+        """
+        if len(self.strings) >= self.prune_size:
+            self.prune()
+        return self.strings.setdefault(value, value)
+
+    def prune(self):
+        """drop strings not used by shared objects
+        """
+        strings = {}
+        for line in self.lines.values():
+            for value in (line.name, line.color, line.code):
+                strings[value] = value
+        for station in self.stations.values():
+            strings[station.name] = station.name
+            strings[station.code] = station.code
+        self.strings = strings
+        self.prune_size = max(1024, len(strings) * 2)
+
+    def latlong(self, latitude, longitude):
+        """Return shared LatLong object.
+        Arguments:
+            latitude -- latitude
+            longitude -- longitude
+        """
+        latlong = LatLong(latitude, longitude)
+        key = (latlong.latitude, latlong.longitude)
+        return self.latlongs.setdefault(key, latlong)
+
+    def line(self, name, color, code):
+        """Return shared Line object keyed by (name, color, code).
+        Arguments:
+            name -- line name
+            color -- line color
+            code -- line code
+        """
+        key = (name, color, code)
+        line = self.lines.get(key)
+        if line is None:
+            line = Line(*[self.string(value) for value in key])
+            self.lines[key] = line
+        return line
+
+    def station(self, idx, name, latlong, code):
+        """Return shared Station object.
+        Arguments:
+            idx -- index
+            name -- station name
+            latlong -- LatLong object
+            code -- station code
+        """
+        station = Station(idx, self.string(name), latlong, self.string(code))
+        key = (station.idx, station.name, id(latlong), station.code)
+        return self.stations.setdefault(key, station)
+
+    def clear(self):
+        """forget all shared objects
+        """
+        self.strings.clear()
+        self.latlongs.clear()
+        self.lines.clear()
+        self.stations.clear()
+
+
+# default of LineInfo.parse, it holds only objects still in use
+INTERNER = Interner()
+
+
+def parse_time(text):
+    """Return minutes after midnight of 'HH:MM'.
+    Arguments:
+        text -- time text
+    """
+    (hours, minutes) = text.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def format_time(minutes):
+    """Return 'HH:MM' of minutes after midnight.
+    Arguments:
+        minutes -- minutes after midnight
+    """
+    return u'%02d:%02d' % divmod(minutes, 60)
+
+
+def format_number(value):
+    """Return shortest text of float as written in line files.
+    Arguments:
+        value -- float
+    """
+    return (u'%.6f' % value).rstrip(u'0').rstrip(u'.')
+
+
+class Stop(object):
+    """It keeps arrival and departure of a trip at a station.
+    """
+    __slots__ = ['idx', 'arrival', 'departure']
+
+    def __init__(self, idx, arrival, departure):
+        """
+        Arguments:
+            idx -- station index
+            arrival -- arrival minutes after midnight
+            departure -- departure minutes after midnight
+        """
+        self.idx = int(idx)
+        self.arrival = int(arrival)
+        self.departure = int(departure)
+
+    def __repr__(self):
+        return u"%s(%d, %d, %d)" % (
+            self.__class__.__name__,
+            self.idx,
+            self.arrival,
+            self.departure,
+            )
+
+    @classmethod
+    def parse(cls, el_stop):
+        """make stop from xml element
+        Arguments:
+            el_stop -- element
+        """
+        departure = el_stop.getAttribute('departure')
+        arrival = el_stop.getAttribute('arrival') or departure
+        departure = departure or arrival
+        return Stop(
+            el_stop.getAttribute('idx'),
+            parse_time(arrival),
+            parse_time(departure),
+            )
+
+
+class Trip(object):
+    """It keeps stops of a train.
+    """
+    __slots__ = ['code', 'stops']
+
+    def __init__(self, code, stops):
+        """
+        Arguments:
+            code -- trip code
+            stops -- Stop object list in running order
+        """
+        self.code = code
+        self.stops = stops
+
+    def __repr__(self):
+        return u"%s(u'%s', %s)" % (
+            self.__class__.__name__,
+            self.code,
+            self.stops.__repr__(),
+            )
+
+    @classmethod
+    def parse(cls, el_trip):
+        """make trip from xml element
+        Arguments:
+            el_trip -- element
+        """
+        return Trip(
+            el_trip.getAttribute('code'),
+            [Stop.parse(el) for el in getChildren(el_trip, 'stop')],
             )
 
 
+class Timetable(object):
+    """It keeps trips of a line.
+    """
+    __slots__ = ['trips']
+
+    def __init__(self, trips):
+        """
+        Arguments:
+            trips -- Trip object list
+        """
+        self.trips = trips
+
+    def __len__(self):
+        return len(self.trips)
+
+    @classmethod
+    def parse(cls, el_timetable):
+        """make timetable from xml element
+        Arguments:
+            el_timetable -- element, None makes no timetable
+        """
+        if not el_timetable:
+            return None
+        return Timetable(
+            [Trip.parse(el) for el in getChildren(el_timetable, 'trip')])
+
+    @classmethod
+    def from_headway(cls, line_info, first, last, headway, dwell=0):
+        """make trips running both ways every headway minutes
+        Arguments:
+            line_info -- LineInfo object
+            first -- first departure minutes after midnight
+            last -- last departure minutes after midnight
+            headway -- minutes between trips
+            dwell -- minutes stopping at each station
+        """
+        trips = []
+        for (direction, begin_idx, end_idx) in [('d', 0, -1), ('u', -1, 0)]:
+            links = list(line_info.gen_links(begin_idx, end_idx))
+            if not links:
+                continue
+            for departure in range(first, last + 1, headway):
+                stops = [Stop(links[0].begin_idx, departure, departure)]
+                time = departure
+                for link in links:
+                    time += link.minutes
+                    stops.append(Stop(link.end_idx, time, time + dwell))
+                    time += dwell
+                trips.append(Trip(u'%s%s' % (direction,
+                                             format_time(departure)),
+                                  stops))
+        return Timetable(trips)
+
+
 class LineInfo(object):
     """It keeps change.
     """
-    __slots__ = ['line', 'stations', 'links', 'changes']
+    __slots__ = ['line', 'stations', 'links', 'changes', 'summaries',
+                 'timetable']
 
-    def __init__(self, line, stations, links, changes):
+    def __init__(self, line, stations, links, changes, timetable=None):
         self.line = line
         self.stations = stations
         self.links = links
         self.changes = changes
+        self.summaries = None
+        self.timetable = timetable
 
     def __unicode__(self):
         return u'%s, %s' % (
@@ -351,6 +712,15 @@ class LineInfo(object):
             self.line.color,
             )
 
+    def get_size(self):
+        """Return number of station indexes, including ones only
+        referred to by links.
+        """
+        return max([len(self.stations)] +
+                   [station.idx + 1 for station in self.stations] +
+                   [link.begin_idx + 1 for link in self.links] +
+                   [link.end_idx + 1 for link in self.links])
+
     def get_stations(self, idx=None):
         """
         Arguments:
@@ -451,6 +821,26 @@ class LineInfo(object):
             idx += len(self.stations)
         return [change for change in self.changes if change.has_idx(idx)]
 
+    def get_change_summary(self, idx):
+        """Return ChangeSummary object of station.
+        Arguments:
+            idx -- station index
+        """
+        while idx < 0:
+            idx += len(self.stations)
+        if self.summaries is None:
+            grouped = {}
+            for change in self.changes:
+                grouped.setdefault(change.idx, []).append(change)
+            self.summaries = dict(
+                [(key, ChangeSummary(key, changes))
+                 for (key, changes) in grouped.items()])
+        summary = self.summaries.get(idx)
+        if summary is None:
+            summary = ChangeSummary(idx, [])
+            self.summaries[idx] = summary
+        return summary
+
     def get_minutes(self, begin_idx, end_idx, base_minutes=0):
         """
         Arguments:
@@ -474,29 +864,107 @@ class LineInfo(object):
             ) - base_kilometers
 
     @classmethod
-    def parse(cls, dom):
+    def parse(cls, dom, interner=INTERNER):
         """make line from xml element
 
         Arguments:
             dom -- element
+            interner -- Interner object, None makes private objects
+        Raises:
+            ParseError -- missing sections or values
         """
         elm = getChild(dom, 'line-info')
-        return LineInfo(
-            Line.parse(elm),
-            [Station.parse(el) for el in getChildren(elm, 'stations/station')],
-            [Link.parse(el) for el in getChildren(elm, 'links/link')],
-            [Change.parse(el) for el in getChildren(elm, 'changes/change')],
-            )
+        try:
+            return cls(
+                Line.parse(elm, interner),
+                [Station.parse(el, interner)
+                 for el in getChildren(elm, 'stations/station')],
+                [Link.parse(el) for el in getChildren(elm, 'links/link')],
+                [Change.parse(el, interner)
+                 for el in getChildren(elm, 'changes/change')],
+                Timetable.parse(getChild(elm, 'timetable')),
+                )
+        except (ValueError, IndexError, AttributeError) as error:
+            from xmlsource import ParseError
+            raise ParseError('broken line-info: %s' % error)
 
     @classmethod
-    def load(cls, filename):
+    def load(cls, filename, interner=INTERNER):
         """load from xmlfile
 
+        Arguments:
+            filename -- lineinfo file name or file object, may be compressed
+            interner -- Interner object, None makes private objects
+        """
+        import xmlsource
+        dom = xmlsource.parse(filename)
+        return cls.parse(dom, interner)
+
+    def write(self, out):
+        """write as xml in utf-8
+        Arguments:
+            out -- file object
+        """
+        from xml.sax.saxutils import quoteattr
+
+        def tag(indent, name, items, close=' /'):
+            attrs = u''.join([u' %s=%s' % (key, quoteattr(unicode(value)))
+                              for (key, value) in items])
+            out.write((u'%s<%s%s%s>\n' % (u' ' * indent, name, attrs,
+                                          close)).encode('utf-8'))
+
+        line = self.line
+        tag(0, 'line-info', [('name', line.name), ('color', line.color),
+                             ('code', line.code)], '')
+        tag(1, 'stations', [], '')
+        for station in self.stations:
+            tag(2, 'station', [
+                ('idx', station.idx),
+                ('code', station.code),
+                ('name', station.name),
+                ('latitude', format_number(station.latlong.latitude)),
+                ('longitude', format_number(station.latlong.longitude)),
+                ])
+        tag(1, '/stations', [], '')
+        tag(1, 'links', [], '')
+        for link in self.links:
+            tag(2, 'link', [
+                ('begin-idx', link.begin_idx),
+                ('end-idx', link.end_idx),
+                ('kilometers', format_number(link.kilometers)),
+                ('minutes', link.minutes),
+                ])
+        tag(1, '/links', [], '')
+        tag(1, 'changes', [], '')
+        for change in self.changes:
+            tag(2, 'change', [('idx', change.idx)], '')
+            tag(3, 'line', [('name', change.line.name),
+                            ('color', change.line.color),
+                            ('code', change.line.code)])
+            tag(3, 'station', [('name', change.station.name),
+                               ('code', change.station.code)])
+            tag(2, '/change', [], '')
+        tag(1, '/changes', [], '')
+        if self.timetable is not None:
+            tag(1, 'timetable', [], '')
+            for trip in self.timetable.trips:
+                tag(2, 'trip', [('code', trip.code)], '')
+                for stop in trip.stops:
+                    tag(3, 'stop', [('idx', stop.idx),
+                                    ('arrival', format_time(stop.arrival)),
+                                    ('departure',
+                                     format_time(stop.departure))])
+                tag(2, '/trip', [], '')
+            tag(1, '/timetable', [], '')
+        tag(0, '/line-info', [], '')
+
+    def save(self, filename):
+        """save to xmlfile
         Arguments:
             filename -- lineinfo file
         """
-        dom = xml.dom.minidom.parse(filename)
-        return cls.parse(dom)
+        with open(filename, 'wb') as xml_file:
+            self.write(xml_file)
 
 
 def test():
@@ -3,11 +3,16 @@
 """Line Map
 """
 import Tkinter as Tk
-import xml.dom.minidom
+import tkFont
 
 from lineinfo import LineInfo
 from lineinfo import Span
 from style import Style
+import tilemap
+from batchcanvas import BatchPainter
+from scheduler import Scheduler
+from sprites import SpriteCache
+from sprites import sprite_key
 
 
 class Point(object):
@@ -18,19 +23,99 @@ class Point(object):
         self.y = int(pos_y)
 
 
+# text smaller than this pixel size is hidden on zoom
+MIN_FONT_SIZE = 6
+
+
+class FontPool(object):
+    """It keeps Tk fonts shared by zoomed text items.
+    """
+    def __init__(self):
+        self.fonts = {}
+
+    def get(self, family, size, weight=''):
+        """Return tkFont.Font object.
+        Arguments:
+            family -- font family
+            size -- font size, negative is pixels
+            weight -- font weight
+        """
+        key = (family, size, weight or 'normal')
+        font = self.fonts.get(key)
+        if font is None:
+            font = tkFont.Font(family=family, size=size,
+                               weight=weight or 'normal')
+            self.fonts[key] = font
+        return font
+
+
+def style_geometry(style):
+    """Return style values which decide item positions.
+    Arguments:
+        style -- decoration info
+    """
+    return (
+        style.body.padding.left,
+        style.body.padding.top,
+        style.body.padding.right,
+        style.body.padding.bottom,
+        style.station.mark.radius,
+        style.station.mark.radius_inside,
+        style.station.text.margin.left,
+        style.link.between,
+        style.change.mark.radius,
+        style.change.mark.radius_inside,
+        style.change.text.height,
+        )
+
+
 class LineMap(Tk.Frame):
     """LineMap widget
     """
-    def __init__(self, master=None, view_size=(320, 480)):
+    def __init__(self, master=None, view_size=(320, 480), raster=False,
+                 tile_height=256, batch=False, frame_budget=None,
+                 sprites=False):
         """
         Arguments:
             master -- parent widget
+            view_size -- view width, view height
+            raster -- draw map into cached image tiles, needs PIL and a
+                      font file
+            tile_height -- height of a raster tile
+            batch -- create canvas items by a few Tcl scripts
+            frame_budget -- seconds of drawing per event loop turn,
+                            None draws at once
+            sprites -- draw marks as cached images, needs PIL
         """
         Tk.Frame.__init__(self, master)
         self.pack()
 
         self.view_size = view_size
         self.map_size = view_size
+        # without a font file, text in tiles can not be drawn
+        self.raster = (raster and tilemap.available() and
+                       tilemap.font_available())
+        self.tile_height = tile_height
+        self.tiles = None
+        self.batch = batch
+        self.scheduler = None
+        self.zoom_scale = 1.0
+        self.fonts = FontPool()
+        self.sprites = None
+        if sprites and tilemap.available():
+            self.sprites = SpriteCache(self)
+        # canvas item id -> (role, color, text) of mark images
+        self.sprite_items = {}
+        # (batch handle, (role, color, text)) until flushed
+        self.pending_sprites = []
+        if frame_budget is not None:
+            self.scheduler = Scheduler(self, frame_budget)
+        # last drawn state
+        self.line_info = None
+        self.style = None
+        self.span = None
+        self.nodes = []
+        self.values = {}
         (view_width, view_height) = self.view_size
         (map_width, map_height) = self.map_size
 
@@ -51,37 +136,76 @@ class LineMap(Tk.Frame):
                                     command=self.view.xview,
                                     orient=Tk.HORIZONTAL)
         self.view["xscrollcommand"] = self.hscroll.set
-        self.view["yscrollcommand"] = self.vscroll.set
+        self.view["yscrollcommand"] = self.on_yscroll
+        self.view.bind('<Control-MouseWheel>', self.on_zoom_wheel)
+        self.view.bind('<Control-Button-4>', self.on_zoom_wheel)
+        self.view.bind('<Control-Button-5>', self.on_zoom_wheel)
         self.view.grid(row=0, column=0)
         self.vscroll.grid(row=0, column=1, sticky=Tk.N + Tk.S)
         self.hscroll.grid(row=1, column=0, sticky=Tk.E + Tk.W)
+        # items are created on painter, canvas, tile recorder or batch
+        self.painter = self.view
+
+    def on_yscroll(self, first, last):
+        """
+        Arguments:
+            first -- top fraction of viewport
+            last -- bottom fraction of viewport
+        """
+        self.vscroll.set(first, last)
+        if self.tiles is not None:
+            self.tiles.place()
 
-    def map_resize(self, line_info, style):
+    def map_resize(self, line_info, style, clear=True):
         map_size = self.calc_map_size(line_info, style, self.view_size)
-        (canvas_width, canvas_height) = map_size
+        self.map_size = map_size
+        (map_width, map_height) = map_size
+        # the scroll position is kept while a zoomed map is drawn again
+        scale = self.zoom_scale
         self.view.configure(scrollregion=(0, 0,
-                                          canvas_width + 1,
-                                          canvas_height + 1))
+                                          map_width * scale + 1,
+                                          map_height * scale + 1))
+        if not clear:
+            return
         for oid in self.view.find_all():
             self.view.delete(oid)
 
-    def draw_mark(self, center, color, mark, text):
+    def draw_mark(self, center, color, mark, text, tags=(), role='station'):
         """
         Arguments:
             center -- center posion
             color -- mark color
             mark -- style mark
             text -- text in mark
+            tags -- item tags
+            role -- 'station' or 'change'
         """
-        for (radius, col) in [
-            (mark.radius, color),
-            (mark.radius_inside, mark.color_inside),
-            ]:
-            self.view.create_oval(center.x - radius, center.y - radius,
-                                  center.x + radius, center.y + radius,
-                                  outline=col,
-                                  fill=col)
-        self.view.create_text(
+        if self.sprites is not None and not self.raster:
+            # one image item instead of two ovals, text stays a text item
+            # so marks of a color share one image
+            handle = self.painter.create_image(
+                center.x,
+                center.y,
+                anchor=Tk.CENTER,
+                image=self.sprites.get(
+                    sprite_key(mark, color, self.zoom_scale)),
+                tags=tags + ('%s-mark-sprite' % role,),
+                )
+            if self.painter is self.view:
+                self.sprite_items[handle] = (role, color)
+            else:
+                self.pending_sprites.append((handle, (role, color)))
+        else:
+            for (radius, col, name) in [
+                (mark.radius, color, 'mark'),
+                (mark.radius_inside, mark.color_inside, 'mark-inside'),
+                ]:
+                self.painter.create_oval(center.x - radius, center.y - radius,
+                                         center.x + radius, center.y + radius,
+                                         outline=col,
+                                         fill=col,
+                                         tags=tags + ('%s-%s' % (role, name),))
+        self.painter.create_text(
             center.x,
             center.y,
             font=(mark.font.family,
@@ -90,22 +214,17 @@ class LineMap(Tk.Frame):
                   ),
             anchor=Tk.CENTER,
             text=text,
+            tags=tags + ('%s-mark-text' % role,),
             )
 
-    def draw_change(self, base, changes, style):
+    def draw_change(self, base, summary, style, tags=()):
         """
         Arguments:
             base -- current node center point
-            changes -- change info list
+            summary -- ChangeSummary object
             style -- decoration info
+            tags -- item tags
         """
-        mark_changes = []
-        text_changes = []
-        for change in changes:
-            if change.line.has_code():
-                mark_changes.append(change)
-            else:
-                text_changes.append(change)
         # mark
         center = Point(
             sum([
@@ -120,17 +239,15 @@ class LineMap(Tk.Frame):
                 style.change.mark.radius,
                 ])
             )
-        for change in mark_changes:
+        for change in summary.mark_changes:
             self.draw_mark(center, change.line.color,
-                           style.change.mark, change.line.code)
+                           style.change.mark, change.line.code,
+                           tags, 'change')
             center.x += style.change.mark.radius * 2
 
         # text
-        if not text_changes:
+        if not summary.text_changes:
             return
-        change_text = u', '.join(
-            ['%s' % change.line.name for change in text_changes]
-            )
         corner = Point(
             sum([
                 base.x,
@@ -142,19 +259,20 @@ class LineMap(Tk.Frame):
                 style.station.mark.radius,
                 ])
             )
-        if mark_changes:
+        if summary.mark_changes:
             corner.y += style.change.mark.radius * 2
-        self.view.create_text(corner.x,
-                              corner.y,
-                              text="%s" % change_text,
-                              anchor=Tk.NW,
-                              font=(style.change.text.font.family,
-                                    style.change.text.font.size,
-                                    ),
-                              fill=style.change.text.color,
-                              )
-
-    def draw_node(self, base, color, name, minutes, style):
+        self.painter.create_text(corner.x,
+                                 corner.y,
+                                 text="%s" % summary.text,
+                                 anchor=Tk.NW,
+                                 font=(style.change.text.font.family,
+                                       style.change.text.font.size,
+                                       ),
+                                 fill=style.change.text.color,
+                                 tags=tags + ('change-text',),
+                                 )
+
+    def draw_node(self, base, color, name, minutes, style, tags=()):
         """
         Argumetns:
             base -- current node center position
@@ -162,26 +280,72 @@ class LineMap(Tk.Frame):
             name -- station name
             minutes -- station minutes
             style -- decoration info
+            tags -- item tags
         """
-        self.draw_mark(base, color, style.station.mark, "%d" % minutes)
+        self.draw_mark(base, color, style.station.mark, "%d" % minutes,
+                       tags)
         mark = style.station.mark
         text = style.station.text
-        self.view.create_text(
+        self.painter.create_text(
             base.x + mark.radius + text.margin.left,
             base.y,
             font=(text.font.family, text.font.size),
             anchor=Tk.W,
-            text="%s" % name)
+            text="%s" % name,
+            tags=tags + ('station-text',))
 
-    def draw(self, line_info, style, span=Span(0, -1)):
+    def draw_station(self, line_info, style, idx, center, values):
+        """
+        Arguments:
+            line_info -- line info
+            style -- decoration info
+            idx -- station index
+            center -- station center point
+            values -- values returned by get_node_values
+        """
+        tags = ('station-%d' % idx,)
+        (name, minutes, marks, text) = values
+        self.draw_node(Point(center.x, center.y), line_info.line.color,
+                       name, minutes, style, tags)
+        self.draw_change(Point(center.x, center.y),
+                         line_info.get_change_summary(idx), style, tags)
+
+    @classmethod
+    def get_node_values(cls, line_info, span, idx, base_minutes):
+        """Return values shown at station.
+        Arguments:
+            line_info -- line info
+            span -- draw station index
+            idx -- station index
+            base_minutes -- minutes of base station
         """
+        summary = line_info.get_change_summary(idx)
+        return (
+            line_info.get_station_name(idx),
+            line_info.get_minutes(span.begin_idx, idx, base_minutes),
+            tuple([(change.line.color, change.line.code)
+                   for change in summary.mark_changes]),
+            summary.text,
+            )
+
+    @classmethod
+    def layout(cls, line_info, style, span):
+        """Return (station index, center Point) list.
+        Arguments:
+            line_info -- line info
+            style -- decoration info
+            span -- draw station index
+        """
+        return list(cls.gen_layout(line_info, style, span))
+
+    @classmethod
+    def gen_layout(cls, line_info, style, span):
+        """(station index, center Point) generator
         Arguments:
             line_info -- line info
             style -- decoration info
             span -- draw station index
         """
-        self.map_resize(line_info, style)
-        # offset
         center_x = sum([
             style.body.padding.left,
             style.station.mark.radius,
@@ -190,48 +354,331 @@ class LineMap(Tk.Frame):
             style.body.padding.top,
             style.station.mark.radius,
             ])
-        base_minutes = line_info.get_minutes(span.begin_idx, span.base_idx)
-        base_kilos = line_info.get_kilometers(span.begin_idx, span.base_idx)
-
-        # draw
-        color = line_info.line.color
-        link_length = 0
-        for link in line_info.gen_links(span.begin_idx, span.end_idx):
-            link_length += sum([
-                style.station.mark.radius,
-                style.link.between,
-                self.calc_change_height(line_info, style, link.begin_idx),
-                style.station.mark.radius,
-                ])
-        # draw link
-        pos_list = [(center_x, center_y),
-                    (center_x, center_y + link_length)]
-        self.view.create_line(*pos_list,
-                              smooth=False,
-                              fill=line_info.line.color,
-                              width=style.link.width)
-
         for station_idx in line_info.gen_stations(span.begin_idx,
                                                   span.end_idx):
-            link_height = sum([
+            yield (station_idx, Point(center_x, center_y))
+            center_y += sum([
                 style.station.mark.radius,
                 style.link.between,
-                self.calc_change_height(line_info, style, station_idx),
+                cls.calc_change_height(line_info, style, station_idx),
                 style.station.mark.radius,
                 ])
-            # draw station
-            kilo = line_info.get_kilometers(
-                span.begin_idx, link.begin_idx, base_kilos)
-            minutes = line_info.get_minutes(
-                span.begin_idx, station_idx, base_minutes)
-            node_name = line_info.get_station_name(station_idx)
-            self.draw_node(Point(center_x, center_y), color, node_name,
-                           minutes, style)
-            # draw change
-            changes = line_info.get_changes(station_idx)
-            self.draw_change(Point(center_x, center_y), changes, style)
-
-            center_y += link_height
+
+    def draw(self, line_info, style, span=Span(0, -1)):
+        """
+        Arguments:
+            line_info -- line info
+            style -- decoration info
+            span -- draw station index
+        """
+        steps = self.gen_draw(line_info, style, span)
+        if self.scheduler is not None:
+            # pending chunks of previous draw are cancelled
+            self.scheduler.start(steps)
+            return
+        for step in steps:
+            pass
+
+    def finish(self):
+        """complete pending scheduled draw
+        """
+        if self.scheduler is not None:
+            self.scheduler.finish()
+
+    def get_visible_range(self):
+        """Return (top, bottom) of viewport in canvas coordinates.
+        """
+        top = self.view.canvasy(0)
+        height = self.view.winfo_height()
+        if height <= 1:
+            # not mapped yet
+            height = self.view_size[1]
+        return (top, top + height)
+
+    def gen_draw(self, line_info, style, span):
+        """draw steps generator, yields after each chunk of work
+        Arguments:
+            line_info -- line info
+            style -- decoration info
+            span -- draw station index
+        """
+        self.painter = self.view
+        if self.tiles is not None:
+            self.tiles.clear()
+            self.tiles = None
+        self.map_resize(line_info, style)
+        self.sprite_items = {}
+        self.pending_sprites = []
+        if self.sprites is not None:
+            self.sprites.clear()
+        if self.raster:
+            self.painter = tilemap.ItemRecorder(self.tile_height)
+        elif self.batch:
+            self.painter = BatchPainter(self.view)
+        scale = self.zoom_scale
+        # items painted directly show up between steps, so they are
+        # zoomed as they are drawn instead of all at the end
+        progressive = (self.scheduler is not None and
+                       self.painter is self.view and scale != 1)
+        nodes = []
+        for node in self.gen_layout(line_info, style, span):
+            nodes.append(node)
+            if len(nodes) % 64 == 0:
+                yield
+        base_minutes = line_info.get_minutes(span.begin_idx, span.base_idx)
+
+        # draw link
+        if nodes:
+            pos_list = [(nodes[0][1].x, nodes[0][1].y),
+                        (nodes[-1][1].x, nodes[-1][1].y)]
+            self.painter.create_line(*pos_list,
+                                     smooth=False,
+                                     fill=line_info.line.color,
+                                     width=style.link.width,
+                                     tags=('link',))
+            if progressive:
+                self.view.scale('link', 0, 0, scale, scale)
+
+        # draw station, visible ones first, viewport in layout coordinates
+        (top, bottom) = self.get_visible_range()
+        (top, bottom) = (top / scale, bottom / scale)
+        margin = style.station.mark.radius * 2 + style.link.between
+        visible = [node for node in nodes
+                   if top - margin <= node[1].y <= bottom + margin]
+        hidden = [node for node in nodes
+                  if not top - margin <= node[1].y <= bottom + margin]
+        values = {}
+        for (pos, (station_idx, center)) in enumerate(visible + hidden):
+            values[station_idx] = self.get_node_values(
+                line_info, span, station_idx, base_minutes)
+            self.draw_station(line_info, style, station_idx, center,
+                              values[station_idx])
+            if progressive:
+                self.view.scale('station-%d' % station_idx,
+                                0, 0, scale, scale)
+                if pos + 1 == len(visible):
+                    # fonts and link width of the viewport
+                    self.style = style
+                    self.configure_zoom()
+            yield
+
+        self.line_info = line_info
+        self.style = style
+        self.span = span
+        self.nodes = nodes
+        self.values = values
+
+        if self.raster:
+            (map_width, map_height) = self.map_size
+            self.tiles = tilemap.TileCache(self.view, self.painter,
+                                           map_width, map_height)
+            self.painter = self.view
+            self.tiles.place()
+        elif self.batch:
+            self.painter.flush()
+            for (handle, values) in self.pending_sprites:
+                self.sprite_items[self.painter.get_id(handle)] = values
+            self.pending_sprites = []
+            self.painter = self.view
+        if not self.raster and scale != 1:
+            if not progressive:
+                self.view.scale('all', 0, 0, scale, scale)
+            self.configure_zoom()
+
+    def zoom(self, factor):
+        """scale drawn items without drawing them again
+        Arguments:
+            factor -- scale factor
+        """
+        self.finish()
+        if self.raster or self.line_info is None:
+            return
+        self.zoom_scale *= factor
+        self.view.scale('all', 0, 0, factor, factor)
+        self.configure_zoom()
+
+    def zoom_in(self):
+        self.zoom(1.25)
+
+    def zoom_out(self):
+        self.zoom(1 / 1.25)
+
+    def on_zoom_wheel(self, event):
+        if event.num == 5 or event.delta < 0:
+            self.zoom_out()
+        else:
+            self.zoom_in()
+
+    def configure_zoom(self):
+        """set scroll region, link width and fonts for zoom scale
+        """
+        scale = self.zoom_scale
+        style = self.style
+        (map_width, map_height) = self.map_size
+        self.view.configure(scrollregion=(0, 0,
+                                          map_width * scale + 1,
+                                          map_height * scale + 1))
+        self.view.itemconfigure(
+            'link', width=max(1, int(round(style.link.width * scale))))
+        for (tag, font, weight) in [
+            ('station-mark-text', style.station.mark.font,
+             style.station.mark.font.weight),
+            ('change-mark-text', style.change.mark.font,
+             style.change.mark.font.weight),
+            ('station-text', style.station.text.font, ''),
+            ('change-text', style.change.text.font, ''),
+            ]:
+            size = int(round(int(font.size or -12) * scale))
+            if abs(size) < MIN_FONT_SIZE:
+                self.view.itemconfigure(tag, state=Tk.HIDDEN)
+                continue
+            self.view.itemconfigure(
+                tag,
+                state=Tk.NORMAL,
+                font=self.fonts.get(font.family, size, weight))
+        if self.sprite_items:
+            self.refresh_sprites()
+
+    def refresh_sprites(self, oids=None):
+        """set mark images for current style and zoom
+        Arguments:
+            oids -- canvas item ids, all mark images if None
+        """
+        style = self.style
+        scale = self.zoom_scale
+        keys = []
+        for oid in oids is None and list(self.sprite_items) or oids:
+            (role, color) = self.sprite_items[oid]
+            key = sprite_key(getattr(style, role).mark, color, scale)
+            keys.append(key)
+            self.view.itemconfigure(oid, image=self.sprites.get(key))
+        if oids is None:
+            # images of old zoom or style are not shown any more
+            self.sprites.retain(keys)
+
+    def update_line(self, line_info):
+        """redraw only stations whose values or positions changed
+        Arguments:
+            line_info -- new line info
+        """
+        self.finish()
+        old_info = self.line_info
+        if old_info is None or self.raster or \
+           line_info.line.color != old_info.line.color:
+            return self.draw(line_info, self.style, self.span)
+        style = self.style
+        span = self.span
+        nodes = self.layout(line_info, style, span)
+        if [idx for (idx, center) in nodes] != \
+           [idx for (idx, center) in self.nodes]:
+            return self.draw(line_info, style, span)
+
+        self.map_resize(line_info, style, clear=False)
+        base_minutes = line_info.get_minutes(span.begin_idx, span.base_idx)
+        scale = self.zoom_scale
+        values = {}
+        for ((idx, center), (old_idx, old_center)) in zip(nodes, self.nodes):
+            values[idx] = self.get_node_values(line_info, span, idx,
+                                               base_minutes)
+            tag = 'station-%d' % idx
+            if values[idx] != self.values[idx]:
+                for oid in self.view.find_withtag(tag):
+                    self.sprite_items.pop(oid, None)
+                self.view.delete(tag)
+                self.draw_station(line_info, style, idx, center, values[idx])
+                if scale != 1:
+                    self.view.scale(tag, 0, 0, scale, scale)
+            elif center.y != old_center.y:
+                self.view.move(tag, 0, (center.y - old_center.y) * scale)
+        if nodes:
+            self.view.coords('link',
+                             nodes[0][1].x * scale, nodes[0][1].y * scale,
+                             nodes[-1][1].x * scale, nodes[-1][1].y * scale)
+        self.line_info = line_info
+        self.nodes = nodes
+        self.values = values
+        if scale != 1:
+            self.configure_zoom()
+
+    def on_link_changed(self, line_info, link):
+        """redraw minutes of stations changed by link
+        Arguments:
+            line_info -- EditableLineInfo object
+            link -- changed link
+        """
+        self.finish()
+        if line_info is not self.line_info:
+            return
+        if self.raster:
+            return self.draw(line_info, self.style, self.span)
+        if not self.nodes:
+            return
+        span = self.span
+        begin_idx = self.nodes[0][0]
+        base_idx = span.base_idx
+        if base_idx < 0:
+            base_idx += len(line_info.stations)
+        low = min(link.begin_idx, link.end_idx)
+        high = max(link.begin_idx, link.end_idx)
+
+        def crosses(idx):
+            # link is on the way from begin station to idx
+            return min(begin_idx, idx) <= low and high <= max(begin_idx, idx)
+
+        # shown minutes change only where link is on one of the ways to
+        # station and to base station
+        base_crossed = crosses(base_idx)
+        base_minutes = None
+        for (idx, center) in self.nodes:
+            if crosses(idx) == base_crossed:
+                continue
+            if base_minutes is None:
+                base_minutes = line_info.get_minutes(span.begin_idx,
+                                                     span.base_idx)
+            old_values = self.values[idx]
+            minutes = line_info.get_minutes(span.begin_idx, idx, base_minutes)
+            if minutes == old_values[1]:
+                continue
+            values = (old_values[0], minutes) + old_values[2:]
+            self.view.itemconfigure(
+                'station-%d&&station-mark-text' % idx,
+                text='%d' % values[1])
+            self.values[idx] = values
+
+    def update_style(self, style):
+        """apply style, redraw all only if positions changed
+        Arguments:
+            style -- new decoration info
+        """
+        self.finish()
+        if self.line_info is None:
+            self.style = style
+            return
+        if self.raster or style_geometry(style) != style_geometry(self.style):
+            return self.draw(self.line_info, style, self.span)
+        self.view.itemconfigure('link', width=style.link.width)
+        for (role, part) in [('station', style.station),
+                             ('change', style.change)]:
+            mark = part.mark
+            self.view.itemconfigure('%s-mark-inside' % role,
+                                    outline=mark.color_inside,
+                                    fill=mark.color_inside)
+            self.view.itemconfigure('%s-mark-text' % role,
+                                    font=(mark.font.family,
+                                          mark.font.size,
+                                          mark.font.weight))
+        self.view.itemconfigure('station-text',
+                                font=(style.station.text.font.family,
+                                      style.station.text.font.size))
+        self.view.itemconfigure('change-text',
+                                font=(style.change.text.font.family,
+                                      style.change.text.font.size),
+                                fill=style.change.text.color)
+        self.style = style
+        if self.zoom_scale != 1:
+            self.configure_zoom()
+        elif self.sprite_items:
+            self.refresh_sprites()
 
     @classmethod
     def calc_change_height(cls, line_info, style, idx):
@@ -241,15 +688,7 @@ class LineMap(Tk.Frame):
             style -- decoration info
             idx -- station index
         """
-        changes = line_info.get_changes(idx)
-        mark_height = 0
-        text_height = 0
-        for change in changes:
-            if change.line.has_code():
-                mark_height = style.change.mark.radius * 2
-            else:
-                text_height = style.change.text.height
-        return mark_height + text_height
+        return line_info.get_change_summary(idx).get_height(style)
 
     @classmethod
     def calc_change(cls, line_info, style, begin_idx=0, end_idx=-1):
@@ -1,36 +1,169 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import time
+START_TIME = time.time()
 
+import argparse
 import os
-import xml.dom.minidom
 
 import Tkinter as Tk
-import tkFileDialog
-import tkMessageBox
 
 from linemap import LineMap
 from linemap import Span
 from lineinfo import LineInfo
 from style import Style
+import snapshot
+
+STYLE_FILE = 'data/style.xml'
+# milliseconds between polls of watched files
+POLL_INTERVAL = 500
+# polls a changed file must stay unchanged before reload
+DEBOUNCE_POLLS = 2
+# runs of each mode in --benchmark
+BENCHMARK_RUNS = 5
+
+
+def get_load_errors():
+    """Return errors of loading a half edited file: broken xml, missing
+    or empty values and sections, file removed while reading. They are
+    imported on first failed reload to keep startup short.
+    """
+    from xml.parsers.expat import ExpatError
+    from xmlsource import ParseError
+    return (ExpatError, ParseError, IOError)
+
+
+def get_stamp(filename):
+    """Return (mtime, size) of file, None if it does not exist.
+    Arguments:
+        filename -- file name
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+class Watch(object):
+    """It keeps state of a polled file.
+    """
+    def __init__(self, filename, callback):
+        """
+        Arguments:
+            filename -- watched file
+            callback -- called with filename after the file settled
+        """
+        self.filename = filename
+        self.callback = callback
+        self.loaded = get_stamp(filename)
+        self.last = self.loaded
+        self.quiet = 0
+
+    def poll(self):
+        """call callback if file changed and stayed unchanged
+        """
+        stamp = get_stamp(self.filename)
+        if stamp != self.last:
+            self.last = stamp
+            self.quiet = 0
+            return
+        if stamp is None or stamp == self.loaded:
+            return
+        self.quiet += 1
+        if self.quiet < DEBOUNCE_POLLS:
+            return
+        self.loaded = stamp
+        self.callback(self.filename)
 
 
 class Application(Tk.Frame):
-    def __init__(self, master=None):
+    def __init__(self, master=None, filename=None, fast=False,
+                 benchmark=False):
+        """
+        Arguments:
+            master -- parent widget
+            filename -- line file opened first
+            fast -- reuse parsed snapshots of unchanged files
+            benchmark -- print time to first frame and quit
+        """
         Tk.Frame.__init__(self, master)
         self.grid()
         self.createWidgets()
 
-        self.style = Style.load('data/style.xml')
+        self.style = None
         self.filename = 'data/'
+        self.fast = fast
+        self.benchmark = benchmark
+        self.watches = []
+        self.shown = None
+        # files are parsed after the window is mapped
+        self.top = self.winfo_toplevel()
+        self.top.bind('<Map>', lambda event: self.on_map(event, filename))
+
+    def on_map(self, event, filename):
+        # children of the toplevel report their <Map> here too
+        if event.widget is not self.top or self.shown is not None:
+            return
+        self.shown = time.time()
+        self.after_idle(self.start, filename)
+
+    def start(self, filename):
+        self.style = self.load_file(STYLE_FILE, Style.load)
+        self.watches = [Watch(STYLE_FILE, self.reload_style)]
+        if filename:
+            self.open_line(filename)
+        if self.benchmark:
+            self.update_idletasks()
+            print 'window shown: %.1f ms' % ((self.shown - START_TIME) * 1000)
+            print 'time-to-first-frame: %.1f ms' % (
+                (time.time() - START_TIME) * 1000)
+            self.after_idle(self.quit)
+            return
+        self.after(POLL_INTERVAL, self.poll)
+
+    def load_file(self, filename, loader):
+        if self.fast:
+            return snapshot.load_cached(filename, loader)
+        return loader(filename)
 
     def load(self):
+        import tkFileDialog
         filename = tkFileDialog.askopenfilename(
             initialdir=os.path.dirname(self.filename))
         if filename:
+            self.open_line(filename)
+
+    def open_line(self, filename):
+        info = self.load_file(filename, LineInfo.load)
+        self.line_map.draw(info, self.style, Span(-1, 0, -1))
+
+        self.filename = filename
+        self.watches[1:] = [Watch(filename, self.reload_line)]
+
+    def poll(self):
+        try:
+            for watch in self.watches:
+                watch.poll()
+        finally:
+            # an unexpected error must not stop watching
+            self.after(POLL_INTERVAL, self.poll)
+
+    def reload_line(self, filename):
+        try:
             info = LineInfo.load(filename)
-            self.line_map.draw(info, self.style, Span(-1, 0, -1))
+        except get_load_errors():
+            # half written file, wait for next change
+            return
+        self.line_map.update_line(info)
 
-            self.filename = filename
+    def reload_style(self, filename):
+        try:
+            style = Style.load(filename)
+        except get_load_errors():
+            return
+        self.style = style
+        self.line_map.update_style(style)
 
     def createWidgets(self):
         menubar = Tk.Menu(tearoff=1)
@@ -43,11 +176,64 @@ class Application(Tk.Frame):
         mn_file.add_command(label="Quit", command=self.quit)
 
         menubar.add_cascade(label="File", menu=mn_file, underline=0)
+        mn_view = Tk.Menu(menubar)
+        mn_view.add_command(label="Zoom In",
+                            command=lambda: self.line_map.zoom_in())
+        mn_view.add_command(label="Zoom Out",
+                            command=lambda: self.line_map.zoom_out())
+        menubar.add_cascade(label="View", menu=mn_view, underline=0)
         self.master.configure(menu=menubar)
 
         self.line_map = LineMap(self)
         self.line_map.grid()
 
-app = Application()
+
+def benchmark(filename, runs=BENCHMARK_RUNS):
+    """print median startup times of fresh viewer processes, cold and
+    with snapshots
+    Arguments:
+        filename -- line file opened first
+        runs -- runs of each mode
+    """
+    import subprocess
+    import sys
+
+    for (label, flags) in [('cold', []), ('fast', ['--fast'])]:
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--benchmark-run'] + flags
+        if filename:
+            command.append(filename)
+        if flags:
+            # the first fast run writes snapshots
+            subprocess.check_output(command)
+        results = {}
+        for run in range(runs):
+            for line in subprocess.check_output(command).splitlines():
+                (name, value) = line.split(':')
+                results.setdefault(name, []).append(float(value.split()[0]))
+        for name in sorted(results):
+            values = sorted(results[name])
+            print '%s %s: %.1f ms (min %.1f ms, max %.1f ms)' % (
+                label, name, values[len(values) // 2], values[0], values[-1])
+
+
+parser = argparse.ArgumentParser(description='linemap viewer')
+parser.add_argument('filename', nargs='?', help='line file opened first')
+parser.add_argument('--fast', action='store_true',
+                    help='reuse parsed snapshots of unchanged files')
+parser.add_argument('--benchmark', action='store_true',
+                    help='compare time to first frame of cold and --fast '
+                    'startup and quit')
+# one measured run of --benchmark
+parser.add_argument('--benchmark-run', action='store_true',
+                    help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+if args.benchmark:
+    benchmark(args.filename)
+    raise SystemExit
+
+app = Application(filename=args.filename, fast=args.fast,
+                  benchmark=args.benchmark_run)
 app.master.title("linemap")
 app.mainloop()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""SQLite store of line files with indexed queries
+"""
+import os
+import sqlite3
+
+from lineinfo import Change
+from lineinfo import LatLong
+from lineinfo import Line
+from lineinfo import LineInfo
+from lineinfo import Link
+from lineinfo import Station
+from lineinfo import gen_line_files
+import xmlsource
+
+
+__all__ = ['NetworkStore']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    color TEXT NOT NULL,
+    code TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lines_code ON lines (code);
+
+CREATE TABLE IF NOT EXISTS stations (
+    line_id INTEGER NOT NULL REFERENCES lines (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    code TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    PRIMARY KEY (line_id, idx)
+);
+CREATE INDEX IF NOT EXISTS stations_name ON stations (name);
+CREATE INDEX IF NOT EXISTS stations_code ON stations (code);
+
+CREATE TABLE IF NOT EXISTS links (
+    line_id INTEGER NOT NULL REFERENCES lines (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    begin_idx INTEGER NOT NULL,
+    end_idx INTEGER NOT NULL,
+    kilometers REAL NOT NULL,
+    minutes INTEGER NOT NULL,
+    PRIMARY KEY (line_id, seq)
+);
+CREATE INDEX IF NOT EXISTS links_begin ON links (line_id, begin_idx);
+
+CREATE TABLE IF NOT EXISTS changes (
+    line_id INTEGER NOT NULL REFERENCES lines (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    line_name TEXT NOT NULL,
+    line_color TEXT NOT NULL,
+    line_code TEXT NOT NULL,
+    station_name TEXT NOT NULL,
+    station_code TEXT NOT NULL,
+    PRIMARY KEY (line_id, seq)
+);
+CREATE INDEX IF NOT EXISTS changes_idx ON changes (line_id, idx);
+CREATE INDEX IF NOT EXISTS changes_target
+    ON changes (line_code, station_code);
+'''
+
+
+def get_key(filename):
+    """Return line key of file, base name without suffixes.
+    Arguments:
+        filename -- line file name
+    """
+    return os.path.splitext(
+        os.path.basename(xmlsource.strip_suffix(filename)))[0]
+
+
+class NetworkStore(object):
+    """It keeps lines, stations, links and changes of line files in a
+    SQLite database.
+    """
+    def __init__(self, path):
+        """
+        Arguments:
+            path -- database file, ':memory:' for a private database
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode = WAL')
+            self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT count(*) FROM lines').fetchone()[0]
+
+    def insert_line(self, key, filename, line_info):
+        """insert line, replacing line of same key
+        Arguments:
+            key -- line key
+            filename -- line file name
+            line_info -- LineInfo object
+        """
+        db = self.db
+        stat = os.stat(filename)
+        db.execute('DELETE FROM lines WHERE key = ?', (key,))
+        line = line_info.line
+        line_id = db.execute(
+            'INSERT INTO lines (key, path, mtime, size, name, color, code) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, os.path.abspath(filename), stat.st_mtime, stat.st_size,
+             line.name, line.color, line.code)).lastrowid
+        db.executemany(
+            'INSERT INTO stations VALUES (?, ?, ?, ?, ?, ?)',
+            [(line_id, station.idx, station.name, station.code,
+              station.latlong.latitude, station.latlong.longitude)
+             for station in line_info.stations])
+        db.executemany(
+            'INSERT INTO links VALUES (?, ?, ?, ?, ?, ?)',
+            [(line_id, seq, link.begin_idx, link.end_idx,
+              link.kilometers, link.minutes)
+             for (seq, link) in enumerate(line_info.links)])
+        db.executemany(
+            'INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(line_id, seq, change.idx,
+              change.line.name, change.line.color, change.line.code,
+              change.station.name, change.station.code)
+             for (seq, change) in enumerate(line_info.changes)])
+        return line_id
+
+    def import_dir(self, dirname, full=False):
+        """import line files of directory in one transaction, unchanged
+        files are skipped and lines of removed files are deleted
+        Arguments:
+            dirname -- directory of line files
+            full -- import all files even if unchanged
+        Returns:
+            {'added', 'updated', 'removed', 'unchanged'} file counts
+        Raises:
+            ValueError -- two files have the same key, e.g. 0001.xml and
+                          0001.xml.gz, or a file has the key of a line
+                          imported from another existing file
+        """
+        db = self.db
+        dirname = os.path.abspath(dirname)
+        known = dict([(row[0], row[1:]) for row in db.execute(
+            'SELECT key, path, mtime, size FROM lines')])
+        report = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        files = {}
+        for filename in gen_line_files(dirname):
+            key = get_key(filename)
+            other = files.get(key)
+            if other is None and key in known:
+                path = known[key][0]
+                if path != filename and os.path.dirname(path) != dirname \
+                        and os.path.exists(path):
+                    other = path
+            if other is not None:
+                raise ValueError('duplicate line key %s: %s, %s' % (
+                    key, other, filename))
+            files[key] = filename
+        seen = set()
+        with db:
+            for (key, filename) in sorted(files.items()):
+                seen.add(key)
+                stat = os.stat(filename)
+                old = known.get(key)
+                if not full and old is not None and \
+                        old == (filename, stat.st_mtime, stat.st_size):
+                    report['unchanged'] += 1
+                    continue
+                self.insert_line(key, filename, LineInfo.load(filename, None))
+                report[old is None and 'added' or 'updated'] += 1
+            for (key, (path, mtime, size)) in known.items():
+                if key not in seen and os.path.dirname(path) == dirname:
+                    db.execute('DELETE FROM lines WHERE key = ?', (key,))
+                    report['removed'] += 1
+        return report
+
+    def get_keys(self, code=None):
+        """Return line keys, lines of code if given.
+        Arguments:
+            code -- line code
+        """
+        if code is None:
+            rows = self.db.execute('SELECT key FROM lines ORDER BY key')
+        else:
+            rows = self.db.execute(
+                'SELECT key FROM lines WHERE code = ? ORDER BY key', (code,))
+        return [row[0] for row in rows]
+
+    def get_line_id(self, key):
+        row = self.db.execute('SELECT id FROM lines WHERE key = ?',
+                              (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def normalize(self, line_id, idx):
+        if idx >= 0:
+            return idx
+        count = self.db.execute(
+            'SELECT count(*) FROM stations WHERE line_id = ?',
+            (line_id,)).fetchone()[0]
+        return idx + count
+
+    def load(self, key, begin_idx=None, end_idx=None):
+        """Return LineInfo of line, only stations in span if given.
+
+        Stations of a span are renumbered from 0, station idx of the line
+        is idx + begin_idx, so negative and default indexes of LineInfo
+        work within the span.
+        Arguments:
+            key -- line key
+            begin_idx -- first station index of span
+            end_idx -- last station index of span
+        """
+        db = self.db
+        line_id = self.get_line_id(key)
+        line = Line(*db.execute('SELECT name, color, code FROM lines '
+                                'WHERE id = ?', (line_id,)).fetchone())
+        where = 'line_id = ?'
+        args = (line_id,)
+        link_where = where
+        offset = 0
+        if begin_idx is not None or end_idx is not None:
+            begin_idx = self.normalize(line_id, begin_idx or 0)
+            if end_idx is None:
+                end_idx = -1
+            end_idx = self.normalize(line_id, end_idx)
+            if begin_idx > end_idx:
+                (begin_idx, end_idx) = (end_idx, begin_idx)
+            where = 'line_id = ? AND idx BETWEEN ? AND ?'
+            link_where = ('line_id = ? AND begin_idx BETWEEN ? AND ? '
+                          'AND end_idx BETWEEN ? AND ?')
+            args = (line_id, begin_idx, end_idx)
+            offset = begin_idx
+        stations = [
+            Station(idx - offset, name, LatLong(latitude, longitude),
+                    code)
+            for (idx, name, code, latitude, longitude) in db.execute(
+                'SELECT idx, name, code, latitude, longitude FROM stations '
+                'WHERE %s ORDER BY idx' % where, args)]
+        links = [
+            Link(begin - offset, end - offset, kilometers, minutes)
+            for (begin, end, kilometers, minutes) in db.execute(
+                'SELECT begin_idx, end_idx, kilometers, minutes FROM links '
+                'WHERE %s ORDER BY seq' % link_where,
+                args + args[1:])]
+        changes = [
+            Change(idx - offset, Line(line_name, line_color, line_code),
+                   Station(-1, station_name, LatLong(0.0, 0.0),
+                           station_code))
+            for (idx, line_name, line_color, line_code, station_name,
+                 station_code) in db.execute(
+                'SELECT idx, line_name, line_color, line_code, '
+                'station_name, station_code FROM changes '
+                'WHERE %s ORDER BY seq' % where, args)]
+        return LineInfo(line, stations, links, changes)
+
+    def find_stations(self, name):
+        """Return (line key, idx) list of stations named name.
+        Arguments:
+            name -- station name
+        """
+        return list(self.db.execute(
+            'SELECT lines.key, stations.idx FROM stations '
+            'JOIN lines ON lines.id = stations.line_id '
+            'WHERE stations.name = ? ORDER BY lines.key', (name,)))
+
+    def find_changes_to(self, line_code, station_code):
+        """Return (line key, idx) list of changes to station.
+        Arguments:
+            line_code -- line code of station
+            station_code -- station code
+        """
+        return list(self.db.execute(
+            'SELECT lines.key, changes.idx FROM changes '
+            'JOIN lines ON lines.id = changes.line_id '
+            'WHERE changes.line_code = ? AND changes.station_code = ? '
+            'ORDER BY lines.key', (line_code, station_code)))
+
+    def get_minutes(self, key, begin_idx, end_idx):
+        """Return minutes of links between stations, summed in database.
+        Arguments:
+            key -- line key
+            begin_idx -- station index
+            end_idx -- station index
+        """
+        line_id = self.get_line_id(key)
+        begin_idx = self.normalize(line_id, begin_idx)
+        end_idx = self.normalize(line_id, end_idx)
+        if begin_idx > end_idx:
+            (begin_idx, end_idx) = (end_idx, begin_idx)
+        return self.db.execute(
+            'SELECT coalesce(sum(minutes), 0) FROM links '
+            'WHERE line_id = ? AND begin_idx >= ? AND begin_idx < ?',
+            (line_id, begin_idx, end_idx)).fetchone()[0]
+
+
+def test():
+    """import sample files and query them
+    """
+    import tempfile
+    import time
+
+    path = os.path.join(tempfile.gettempdir(), 'linemap-test.db')
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    store = NetworkStore(path)
+    start = time.time()
+    print store.import_dir('data'), '%.1f ms' % ((time.time() - start) * 1000)
+    start = time.time()
+    print store.import_dir('data'), '%.1f ms' % ((time.time() - start) * 1000)
+
+    key = store.get_keys()[0]
+    line_info = store.load(key)
+    print key, line_info.line.code, len(line_info.stations), \
+        line_info.get_minutes(0, -1), store.get_minutes(key, 0, -1)
+    span = store.load(key, 2, 5)
+    print [station.idx for station in span.stations], \
+        span.get_minutes(0, -1), line_info.get_minutes(2, 5)
+    print store.find_stations(line_info.get_station_name(0))
+    store.close()
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""HTTP/JSON query server over loaded line files
+"""
+import argparse
+import BaseHTTPServer
+import json
+import os
+import Queue
+import random
+import SocketServer
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+
+from lineinfo import LineInfo
+from lineinfo import gen_line_files
+import xmlsource
+
+
+__all__ = ['LineIndex', 'QueryServer', 'serve', 'run_load']
+
+
+class LineIndex(object):
+    """It keeps read-only lookup tables of a line.
+    """
+    def __init__(self, key, line_info):
+        """
+        Arguments:
+            key -- line id used in urls
+            line_info -- LineInfo object
+        """
+        self.key = key
+        self.line_info = line_info
+        size = line_info.get_size()
+        minutes = [0] * size
+        kilometers = [0.0] * size
+        for link in line_info.links:
+            minutes[link.begin_idx] += link.minutes
+            kilometers[link.begin_idx] += link.kilometers
+        # prefix sums, value before station idx
+        self.minutes = [0]
+        self.kilometers = [0.0]
+        for idx in range(size):
+            self.minutes.append(self.minutes[-1] + minutes[idx])
+            self.kilometers.append(self.kilometers[-1] + kilometers[idx])
+        self.stations = dict([(station.idx, station)
+                              for station in line_info.stations])
+
+    def normalize(self, idx):
+        """Return station index of idx, negative counts from last.
+        Raises:
+            QueryError -- 404 if no station has idx
+        """
+        idx = int(idx)
+        count = len(self.line_info.stations)
+        if not -count <= idx < count:
+            raise QueryError(404, 'no station %d' % idx)
+        return idx % count
+
+    def get_span(self, prefix, begin_idx, end_idx):
+        begin_idx = self.normalize(begin_idx)
+        end_idx = self.normalize(end_idx)
+        if begin_idx > end_idx:
+            (begin_idx, end_idx) = (end_idx, begin_idx)
+        end_idx = min(end_idx, len(prefix) - 1)
+        begin_idx = min(begin_idx, end_idx)
+        return prefix[end_idx] - prefix[begin_idx]
+
+    def get_minutes(self, begin_idx, end_idx, base_idx=None):
+        base = 0
+        if base_idx is not None:
+            base = self.get_span(self.minutes, begin_idx, base_idx)
+        return self.get_span(self.minutes, begin_idx, end_idx) - base
+
+    def get_kilometers(self, begin_idx, end_idx, base_idx=None):
+        base = 0
+        if base_idx is not None:
+            base = self.get_span(self.kilometers, begin_idx, base_idx)
+        return self.get_span(self.kilometers, begin_idx, end_idx) - base
+
+    def get_station(self, idx):
+        station = self.stations.get(self.normalize(idx))
+        if station is None:
+            return None
+        return {
+            'idx': station.idx,
+            'name': station.name,
+            'code': station.code,
+            'latitude': station.latlong.latitude,
+            'longitude': station.latlong.longitude,
+            }
+
+    def get_changes(self, idx):
+        summary = self.line_info.get_change_summary(self.normalize(idx))
+        return [{
+            'line': change.line.name,
+            'color': change.line.color,
+            'code': change.line.code,
+            'station': change.station.name,
+            'station_code': change.station.code,
+            } for change in summary.mark_changes + summary.text_changes]
+
+    def get_info(self):
+        line = self.line_info.line
+        return {
+            'id': self.key,
+            'name': line.name,
+            'color': line.color,
+            'code': line.code,
+            'stations': len(self.line_info.stations),
+            }
+
+    def get_stations(self, begin_idx, end_idx, base_idx):
+        line_info = self.line_info
+        result = []
+        for idx in line_info.gen_stations(self.normalize(begin_idx),
+                                          self.normalize(end_idx)):
+            station = self.get_station(idx)
+            station['minutes'] = self.get_minutes(begin_idx, idx, base_idx)
+            station['kilometers'] = self.get_kilometers(begin_idx, idx,
+                                                        base_idx)
+            station['changes'] = self.get_changes(idx)
+            result.append(station)
+        return result
+
+
+def load_indexes(data_dir):
+    """Return {line id: LineIndex} of line files in directory.
+    Arguments:
+        data_dir -- directory of line files
+    """
+    indexes = {}
+    for filename in gen_line_files(data_dir):
+        line_info = LineInfo.load(filename)
+        key = os.path.splitext(
+            os.path.basename(xmlsource.strip_suffix(filename)))[0]
+        indexes[key] = LineIndex(key, line_info)
+        if line_info.line.code and line_info.line.code not in indexes:
+            indexes[line_info.line.code] = indexes[key]
+    return indexes
+
+
+class QueryError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """It answers GET requests
+
+    /lines
+    /lines/<id>
+    /lines/<id>/minutes?begin=&end=[&base=]
+    /lines/<id>/kilometers?begin=&end=[&base=]
+    /lines/<id>/stations?begin=&end=[&base=]
+    /lines/<id>/stations/<idx>
+    /lines/<id>/changes/<idx>
+    """
+    def do_GET(self):
+        try:
+            status = 200
+            result = self.query()
+        except QueryError as error:
+            status = error.status
+            result = {'error': str(error)}
+        except (ValueError, KeyError) as error:
+            status = 400
+            result = {'error': 'bad request: %s' % error}
+        body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def query(self):
+        url = urlparse.urlparse(self.path)
+        params = dict([(key, values[-1]) for (key, values)
+                       in urlparse.parse_qs(url.query).items()])
+        names = [urllib.unquote(name) for name in url.path.split('/')
+                 if name]
+        indexes = self.server.indexes
+        if names == ['lines']:
+            keys = sorted(set([index.key for index in indexes.values()]))
+            return [indexes[key].get_info() for key in keys]
+        if len(names) < 2 or names[0] != 'lines':
+            raise QueryError(404, 'not found')
+        index = indexes.get(names[1].decode('utf-8'))
+        if index is None:
+            raise QueryError(404, 'no line %s' % names[1])
+        names = names[2:]
+        begin_idx = params.get('begin', 0)
+        end_idx = params.get('end', -1)
+        base_idx = params.get('base')
+        if not names:
+            return index.get_info()
+        if names == ['minutes']:
+            return index.get_minutes(begin_idx, end_idx, base_idx)
+        if names == ['kilometers']:
+            return index.get_kilometers(begin_idx, end_idx, base_idx)
+        if names == ['stations']:
+            return index.get_stations(begin_idx, end_idx, base_idx)
+        if len(names) == 2 and names[0] == 'stations':
+            station = index.get_station(names[1])
+            if station is None:
+                raise QueryError(404, 'no station %s' % names[1])
+            return station
+        if len(names) == 2 and names[0] == 'changes':
+            return index.get_changes(names[1])
+        raise QueryError(404, 'not found')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(
+                self, format, *args)
+
+
+class QueryServer(SocketServer.TCPServer):
+    """It serves requests from a fixed pool of threads.
+    """
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, indexes, threads=8, verbose=False):
+        """
+        Arguments:
+            address -- (host, port)
+            indexes -- {line id: LineIndex}
+            threads -- number of worker threads
+            verbose -- log each request
+        """
+        SocketServer.TCPServer.__init__(self, address, QueryHandler)
+        self.indexes = indexes
+        self.verbose = verbose
+        self.requests = Queue.Queue()
+        self.workers = []
+        for count in range(threads):
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def work(self):
+        while True:
+            (request, client_address) = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+
+def serve(data_dir, host='127.0.0.1', port=8080, threads=8, verbose=False):
+    """load line files and serve queries until interrupted
+    Arguments:
+        data_dir -- directory of line files
+        host -- listen address
+        port -- listen port
+        threads -- number of worker threads
+        verbose -- log each request
+    """
+    indexes = load_indexes(data_dir)
+    server = QueryServer((host, port), indexes, threads, verbose)
+    print 'serving %d lines on http://%s:%d/' % (
+        len(set(indexes.values())), host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def gen_paths(base_url, lines):
+    """random query url generator
+    Arguments:
+        base_url -- server url
+        lines -- /lines result
+    """
+    while True:
+        line = random.choice(lines)
+        size = line['stations']
+        begin_idx = random.randrange(-size, size)
+        end_idx = random.randrange(-size, size)
+        path = random.choice([
+            '/lines/%s/minutes?begin=%d&end=%d',
+            '/lines/%s/kilometers?begin=%d&end=%d',
+            '/lines/%s/stations/%d',
+            '/lines/%s/changes/%d',
+            '/lines/%s/stations?begin=%d&end=%d',
+            ])
+        count = path.count('%d')
+        yield base_url + path % ((line['id'], begin_idx, end_idx)[:count + 1])
+
+
+def run_load(base_url, concurrency=8, count=2000):
+    """issue random queries and report latency
+    Arguments:
+        base_url -- server url
+        concurrency -- number of client threads
+        count -- number of requests
+    Returns:
+        {'requests', 'errors', 'seconds', 'qps', 'p50', 'p99'}, ms latency
+    """
+    lines = json.load(urllib2.urlopen(base_url + '/lines'))
+    paths = gen_paths(base_url, lines)
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    remaining = [count]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                url = next(paths)
+            start = time.time()
+            try:
+                urllib2.urlopen(url).read()
+            except (urllib2.URLError, IOError):
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = time.time() - start
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.time()
+    clients = [threading.Thread(target=client) for count in
+               range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    seconds = time.time() - start
+
+    latencies.sort()
+
+    def percentile(rate):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1,
+                             int(len(latencies) * rate))] * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': seconds,
+        'qps': len(latencies) / seconds,
+        'p50': percentile(0.50),
+        'p99': percentile(0.99),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='line query server')
+    commands = parser.add_subparsers(dest='command')
+    serve_parser = commands.add_parser('serve', help='serve queries')
+    serve_parser.add_argument('--data', default='data')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--threads', type=int, default=8)
+    serve_parser.add_argument('--verbose', action='store_true')
+    bench_parser = commands.add_parser(
+        'bench', help='measure latency, starts a server without --url')
+    bench_parser.add_argument('--url')
+    bench_parser.add_argument('--data', default='data')
+    bench_parser.add_argument('--threads', type=int, default=8)
+    bench_parser.add_argument('--concurrency', type=int, default=8)
+    bench_parser.add_argument('--count', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.data, args.host, args.port, args.threads, args.verbose)
+        return
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = QueryServer(('127.0.0.1', 0), load_indexes(args.data),
+                             args.threads)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+    report = run_load(base_url.rstrip('/'), args.concurrency, args.count)
+    print ('%(requests)d requests, %(errors)d errors in %(seconds).2f s: '
+           '%(qps).0f qps, p50 %(p50).2f ms, p99 %(p99).2f ms' % report)
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time sliced job runner on Tk event loop
+"""
+import time
+
+
+__all__ = ['Scheduler']
+
+
+class Scheduler(object):
+    """It runs a generator in chunks limited by a frame budget.
+
+    Each step of the generator is a unit of work; after the budget is spent
+    the rest is continued by after(), so the event loop keeps handling
+    input and repaint between chunks.
+    """
+    def __init__(self, widget, budget=0.008, interval=1):
+        """
+        Arguments:
+            widget -- Tk widget used for after()
+            budget -- seconds spent in one chunk
+            interval -- milliseconds between chunks
+        """
+        self.widget = widget
+        self.budget = budget
+        self.interval = interval
+        self.steps = None
+        self.job = None
+
+    def is_running(self):
+        """Return true if steps are pending, false otherwise.
+        """
+        return self.steps is not None
+
+    def start(self, steps):
+        """cancel pending steps and start new steps
+        Arguments:
+            steps -- generator
+        """
+        self.cancel()
+        self.steps = steps
+        self.job = self.widget.after_idle(self.run)
+
+    def run(self):
+        self.job = None
+        deadline = time.time() + self.budget
+        try:
+            while True:
+                next(self.steps)
+                if time.time() >= deadline:
+                    break
+        except StopIteration:
+            self.steps = None
+            return
+        self.job = self.widget.after(self.interval, self.run)
+
+    def cancel(self):
+        """drop pending steps
+        """
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+        if self.steps is not None:
+            self.steps.close()
+            self.steps = None
+
+    def finish(self):
+        """run pending steps now
+        """
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+        steps = self.steps
+        self.steps = None
+        if steps is not None:
+            for step in steps:
+                pass
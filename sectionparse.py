@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Parallel parsing of one large line file by sections
+"""
+import mmap
+import multiprocessing
+import re
+import xml.parsers.expat
+
+from lineinfo import INTERNER
+from lineinfo import Change
+from lineinfo import Line
+from lineinfo import LineInfo
+from lineinfo import Link
+from lineinfo import Station
+from lineinfo import Timetable
+from lineinfo import Trip
+
+
+__all__ = ['load', 'find_chunks']
+
+# bytes of a chunk given to a worker
+CHUNK_SIZE = 1 << 20
+
+# section tag, element tag
+SECTIONS = [
+    ('stations', 'station'),
+    ('links', 'link'),
+    ('changes', 'change'),
+    ('timetable', 'trip'),
+    ]
+
+# element tag, function making object of Element and interner
+BUILDERS = {
+    'station': Station.parse,
+    'link': lambda element, interner: Link.parse(element),
+    'change': Change.parse,
+    'trip': lambda element, interner: Trip.parse(element),
+    }
+
+ENCODING = re.compile(r'<\?xml[^>]*encoding=["\']([-\w.]+)["\']')
+
+
+class Element(object):
+    """It is a minimal dom element over (tag, attributes, children) tuple
+    returned by workers, enough for parse methods of lineinfo.
+    """
+    __slots__ = ['tagName', 'attributes', 'children']
+
+    def __init__(self, node):
+        (self.tagName, self.attributes, self.children) = node
+
+    def getAttribute(self, name):
+        return self.attributes.get(name, u'')
+
+    def getElementsByTagName(self, name):
+        found = []
+        for node in self.children:
+            child = Element(node)
+            if child.tagName == name:
+                found.append(child)
+            found.extend(child.getElementsByTagName(name))
+        return found
+
+
+def parse_nodes(text, encoding):
+    """Return (tag, attributes, children) tuples of top level elements.
+    Arguments:
+        text -- xml fragment without declaration
+        encoding -- encoding of text
+    """
+    root = (None, {}, [])
+    stack = [root]
+
+    def start(tag, attributes):
+        node = (tag, attributes, [])
+        stack[-1][2].append(node)
+        stack.append(node)
+
+    def end(tag):
+        stack.pop()
+
+    parser = xml.parsers.expat.ParserCreate(encoding)
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.Parse('<chunk>%s</chunk>' % text, True)
+    return root[2][0][2]
+
+
+def find_section(buf, tag, start=0):
+    """Return (begin, end) of section content, None if missing.
+    Arguments:
+        buf -- mmap or string of file
+        tag -- section tag
+        start -- position to search from
+    """
+    match = re.compile(r'<%s(\s[^>]*)?(/?)>' % tag).search(buf, start)
+    if match is None:
+        return None
+    if match.group(2):
+        return (match.end(), match.end())
+    end = buf.find('</%s>' % tag, match.end())
+    if end < 0:
+        raise ValueError('section %s is not closed' % tag)
+    return (match.end(), end)
+
+
+def find_chunks(buf, chunk_size=CHUNK_SIZE):
+    """Return (element tag, begin, end) list of byte ranges, each range
+    holds whole elements.
+    Arguments:
+        buf -- mmap or string of file
+        chunk_size -- bytes of a chunk
+    """
+    root = find_section(buf, 'line-info')
+    if root is None:
+        raise ValueError('no line-info')
+    chunks = []
+    for (section, element) in SECTIONS:
+        found = find_section(buf, section, root[0])
+        if found is None:
+            continue
+        (begin, end) = found
+        start = re.compile(r'<%s[\s/>]' % element)
+        while begin < end:
+            split = end
+            if begin + chunk_size < end:
+                match = start.search(buf, begin + chunk_size, end)
+                if match is not None:
+                    split = match.start()
+            chunks.append((element, begin, split))
+            begin = split
+    return chunks
+
+
+def get_encoding(buf):
+    match = ENCODING.match(buf[:256])
+    if match is None:
+        return 'utf-8'
+    return match.group(1)
+
+
+def parse_chunk(args):
+    """Return (element tag, node tuples) of elements in byte range, plain
+    tuples are cheap to send back to parent.
+    Arguments:
+        args -- (filename, element tag, begin, end)
+    """
+    (filename, element, begin, end) = args
+    with open(filename, 'rb') as xml_file:
+        buf = mmap.mmap(xml_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        encoding = get_encoding(buf)
+        text = buf[begin:end]
+    finally:
+        buf.close()
+    return (element, [node for node in parse_nodes(text, encoding)
+                      if node[0] == element])
+
+
+def parse_head(buf, interner):
+    """Return Line of line-info start tag.
+    Arguments:
+        buf -- mmap or string of file
+        interner -- Interner object
+    """
+    match = re.compile(r'<line-info(\s[^>]*)?>').search(buf)
+    if match is None:
+        raise ValueError('no line-info')
+    nodes = parse_nodes(match.group(0).rstrip('/>') + '/>', get_encoding(buf))
+    return Line.parse(Element(nodes[0]), interner)
+
+
+def load(filename, interner=INTERNER, processes=None, chunk_size=CHUNK_SIZE,
+         pool=None):
+    """load plain line file, sections are parsed in worker processes
+    Arguments:
+        filename -- plain xml line file
+        interner -- Interner object, None makes private objects
+        processes -- number of workers, cpu count if None
+        chunk_size -- bytes given to a worker at once
+        pool -- multiprocessing.Pool object, made for this call if None
+    """
+    with open(filename, 'rb') as xml_file:
+        buf = mmap.mmap(xml_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        line = parse_head(buf, interner)
+        chunks = find_chunks(buf, chunk_size)
+        has_timetable = find_section(buf, 'timetable') is not None
+    finally:
+        buf.close()
+
+    own_pool = pool is None
+    if own_pool:
+        pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.imap(parse_chunk,
+                            [(filename, element, begin, end)
+                             for (element, begin, end) in chunks])
+        objects = dict([(element, []) for element in BUILDERS])
+        # build objects of finished chunks while workers parse the rest
+        for (element, nodes) in results:
+            build = BUILDERS[element]
+            objects[element].extend([build(Element(node), interner)
+                                     for node in nodes])
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+
+    timetable = None
+    if has_timetable:
+        timetable = Timetable(objects['trip'])
+    return LineInfo(line, objects['station'], objects['link'],
+                    objects['change'], timetable)
+
+
+def make_sample(filename, count):
+    """write line file of count stations
+    Arguments:
+        filename -- output file name
+        count -- number of stations
+    """
+    with open(filename, 'wb') as xml_file:
+        write = xml_file.write
+        write('<?xml version="1.0" encoding="utf-8"?>\n')
+        write('<line-info name="sample" color="#888888" code="S">\n')
+        write(' <stations>\n')
+        for idx in xrange(count):
+            write('  <station idx="%d" code="%d" name="station %d" '
+                  'latitude="%f" longitude="%f" />\n' % (
+                      idx, idx, idx, 35 + idx * 1e-4, 139 + idx * 1e-4))
+        write(' </stations>\n <links>\n')
+        for idx in xrange(count - 1):
+            write('  <link begin-idx="%d" end-idx="%d" kilometers="1.2" '
+                  'minutes="2" />\n' % (idx, idx + 1))
+        write(' </links>\n <changes>\n')
+        for idx in xrange(0, count, 10):
+            write('  <change idx="%d">\n'
+                  '   <line name="other" color="#000000" code="O" />\n'
+                  '   <station name="station %d" code="%d" />\n'
+                  '  </change>\n' % (idx, idx, idx))
+        write(' </changes>\n</line-info>\n')
+
+
+def test():
+    """compare serial and parallel load of a generated file
+    """
+    import os
+    import tempfile
+    import time
+
+    filename = os.path.join(tempfile.gettempdir(), 'linemap-sample.xml')
+    make_sample(filename, 100000)
+    print '%d bytes' % os.path.getsize(filename)
+
+    start = time.time()
+    serial = LineInfo.load(filename)
+    print 'serial %.2f s' % (time.time() - start)
+
+    pool = multiprocessing.Pool()
+    start = time.time()
+    parallel = load(filename, pool=pool)
+    print 'parallel %.2f s, %d processes' % (time.time() - start,
+                                             multiprocessing.cpu_count())
+    pool.close()
+    pool.join()
+
+    for key in ['stations', 'links', 'changes']:
+        print key, len(getattr(serial, key)), len(getattr(parallel, key))
+    print serial.get_minutes(0, -1), parallel.get_minutes(0, -1)
+    os.remove(filename)
+
+
+if __name__ == '__main__':
+    test()
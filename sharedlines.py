@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Line infos published in shared memory for worker processes
+"""
+import mmap
+import os
+import struct
+import tempfile
+
+from lineinfo import Change
+from lineinfo import LatLong
+from lineinfo import Line
+from lineinfo import LineInfo
+from lineinfo import Link
+from lineinfo import Station
+
+
+__all__ = ['SharedNetwork', 'SharedLineInfo', 'publish']
+
+MAGIC = 'LMAP0001'
+# magic, string count, line count, station count, link count, change count
+HEADER = struct.Struct('<8s5i')
+# name, color, code, station start, station count, link start, link count,
+# change start, change count
+LINE = struct.Struct('<9i')
+# idx, name, code, latitude, longitude
+STATION = struct.Struct('<3i2d')
+# begin idx, end idx, kilometers, minutes
+LINK = struct.Struct('<2idi')
+# idx, line name, line color, line code, station name, station code
+CHANGE = struct.Struct('<6i')
+# string offset
+OFFSET = struct.Struct('<i')
+
+
+def get_shm_dir():
+    """Return directory of shared memory files.
+    """
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def get_path(name):
+    return os.path.join(get_shm_dir(), 'linemap-%s' % name)
+
+
+class StringPool(object):
+    """It numbers strings while writing.
+    """
+    def __init__(self):
+        self.refs = {}
+        self.values = []
+
+    def get_ref(self, value):
+        ref = self.refs.get(value)
+        if ref is None:
+            ref = len(self.values)
+            self.refs[value] = ref
+            self.values.append(value)
+        return ref
+
+
+def publish(line_infos, name):
+    """write line infos into shared memory file
+    Arguments:
+        line_infos -- LineInfo object list
+        name -- name given to SharedNetwork.attach
+    Returns:
+        SharedNetwork object attached to the file
+    """
+    strings = StringPool()
+    lines = []
+    stations = []
+    links = []
+    changes = []
+    for line_info in line_infos:
+        line = line_info.line
+        lines.append(LINE.pack(
+            strings.get_ref(line.name),
+            strings.get_ref(line.color),
+            strings.get_ref(line.code),
+            len(stations), len(line_info.stations),
+            len(links), len(line_info.links),
+            len(changes), len(line_info.changes)))
+        for station in line_info.stations:
+            stations.append(STATION.pack(
+                station.idx,
+                strings.get_ref(station.name),
+                strings.get_ref(station.code),
+                station.latlong.latitude,
+                station.latlong.longitude))
+        for link in line_info.links:
+            links.append(LINK.pack(link.begin_idx, link.end_idx,
+                                   link.kilometers, link.minutes))
+        for change in line_info.changes:
+            changes.append(CHANGE.pack(
+                change.idx,
+                strings.get_ref(change.line.name),
+                strings.get_ref(change.line.color),
+                strings.get_ref(change.line.code),
+                strings.get_ref(change.station.name),
+                strings.get_ref(change.station.code)))
+
+    blobs = [value.encode('utf-8') for value in strings.values]
+    offsets = []
+    position = 0
+    for blob in blobs:
+        offsets.append(OFFSET.pack(position))
+        position += len(blob)
+    offsets.append(OFFSET.pack(position))
+
+    path = get_path(name)
+    temp_path = '%s.%d' % (path, os.getpid())
+    with open(temp_path, 'wb') as shm_file:
+        shm_file.write(HEADER.pack(MAGIC, len(blobs), len(lines),
+                                   len(stations), len(links), len(changes)))
+        for records in [lines, stations, links, changes, offsets, blobs]:
+            shm_file.write(''.join(records))
+    os.rename(temp_path, path)
+    return SharedNetwork.attach(name)
+
+
+class RecordView(object):
+    """It is a read-only sequence of records in shared memory.
+    """
+    __slots__ = ['network', 'record', 'offset', 'count', 'factory']
+
+    def __init__(self, network, record, offset, count, factory):
+        """
+        Arguments:
+            network -- SharedNetwork object
+            record -- struct.Struct of a record
+            offset -- byte offset of first record
+            count -- number of records
+            factory -- makes object from unpacked values
+        """
+        self.network = network
+        self.record = record
+        self.offset = offset
+        self.count = count
+        self.factory = factory
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[pos] for pos in range(*idx.indices(self.count))]
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        return self.factory(*self.record.unpack_from(
+            self.network.buffer, self.offset + idx * self.record.size))
+
+    def __iter__(self):
+        for idx in xrange(self.count):
+            yield self[idx]
+
+
+class SharedLineInfo(LineInfo):
+    """It is a LineInfo whose stations, links and changes are read from
+    shared memory on access.
+    """
+    __slots__ = ['network']
+
+    def __init__(self, network, values):
+        """
+        Arguments:
+            network -- SharedNetwork object
+            values -- unpacked LINE record
+        """
+        (name, color, code, station_start, station_count,
+         link_start, link_count, change_start, change_count) = values
+        get_string = network.get_string
+        LineInfo.__init__(
+            self,
+            Line(get_string(name), get_string(color), get_string(code)),
+            RecordView(network, STATION,
+                       network.offsets['station'] +
+                       station_start * STATION.size,
+                       station_count, network.make_station),
+            RecordView(network, LINK,
+                       network.offsets['link'] + link_start * LINK.size,
+                       link_count, Link),
+            RecordView(network, CHANGE,
+                       network.offsets['change'] +
+                       change_start * CHANGE.size,
+                       change_count, network.make_change))
+        self.network = network
+
+
+class SharedNetwork(object):
+    """It is attached shared memory holding published line infos.
+    """
+    def __init__(self, name, buffer):
+        """
+        Arguments:
+            name -- published name
+            buffer -- mmap object
+        """
+        self.name = name
+        self.buffer = buffer
+        (magic, string_count, line_count, station_count, link_count,
+         change_count) = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a published network' % name)
+        self.offsets = {}
+        position = HEADER.size
+        for (key, record, count) in [
+            ('line', LINE, line_count),
+            ('station', STATION, station_count),
+            ('link', LINK, link_count),
+            ('change', CHANGE, change_count),
+            ('string', OFFSET, string_count + 1),
+            ]:
+            self.offsets[key] = position
+            position += record.size * count
+        self.offsets['blob'] = position
+        self.string_count = string_count
+        self.strings = {}
+        self.lines = [
+            SharedLineInfo(self, LINE.unpack_from(
+                buffer, self.offsets['line'] + idx * LINE.size))
+            for idx in range(line_count)]
+
+    def __len__(self):
+        return len(self.lines)
+
+    @classmethod
+    def attach(cls, name):
+        """attach published line infos read-only
+        Arguments:
+            name -- name given to publish
+        """
+        with open(get_path(name), 'rb') as shm_file:
+            buffer = mmap.mmap(shm_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(name, buffer)
+
+    def get_string(self, ref):
+        """Return string of pool.
+        Arguments:
+            ref -- string number
+        """
+        value = self.strings.get(ref)
+        if value is None:
+            position = self.offsets['string'] + ref * OFFSET.size
+            (begin, end) = struct.unpack_from('<2i', self.buffer, position)
+            blob = self.offsets['blob']
+            value = self.buffer[blob + begin:blob + end].decode('utf-8')
+            self.strings[ref] = value
+        return value
+
+    def make_station(self, idx, name, code, latitude, longitude):
+        return Station(idx, self.get_string(name),
+                       LatLong(latitude, longitude), self.get_string(code))
+
+    def make_change(self, idx, line_name, line_color, line_code,
+                    station_name, station_code):
+        return Change(idx,
+                      Line(self.get_string(line_name),
+                           self.get_string(line_color),
+                           self.get_string(line_code)),
+                      Station(-1, self.get_string(station_name),
+                              LatLong(0.0, 0.0),
+                              self.get_string(station_code)))
+
+    def close(self):
+        """detach shared memory
+        """
+        self.lines = []
+        self.buffer.close()
+
+    def unlink(self):
+        """remove published file, attached processes keep their mapping
+        """
+        try:
+            os.remove(get_path(self.name))
+        except OSError:
+            pass
+
+
+def worker_minutes(name):
+    network = SharedNetwork.attach(name)
+    result = [(line_info.line.code, line_info.get_minutes(0, -1))
+              for line_info in network.lines]
+    network.close()
+    return result
+
+
+def test():
+    """publish lines and read them from worker processes
+    """
+    import multiprocessing
+    from lineinfo import gen_line_files
+
+    infos = [LineInfo.load(filename) for filename in gen_line_files('data')]
+    network = publish(infos, 'test')
+    pool = multiprocessing.Pool(4)
+    print pool.map(worker_minutes, ['test'] * 4)[0]
+    print [info.get_minutes(0, -1) for info in infos]
+    pool.close()
+    pool.join()
+    network.close()
+    network.unlink()
+
+
+if __name__ == '__main__':
+    test()
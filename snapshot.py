@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Pickled snapshots of parsed files
+"""
+import cPickle as pickle
+import hashlib
+import os
+
+
+__all__ = ['load_cached']
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'linemap')
+
+
+def get_stamp(filename):
+    """Return (mtime, size) of file.
+    Arguments:
+        filename -- file name
+    """
+    stat = os.stat(filename)
+    return (stat.st_mtime, stat.st_size)
+
+
+def get_cache_name(filename, cache_dir=CACHE_DIR):
+    """Return snapshot file name of file.
+    Arguments:
+        filename -- parsed file name
+        cache_dir -- snapshot directory
+    """
+    path = os.path.abspath(filename)
+    digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, '%s-%s.pickle' % (
+        os.path.basename(path), digest))
+
+
+def load_cached(filename, loader, cache_dir=CACHE_DIR):
+    """Return loader(filename), reuse snapshot while file is unchanged.
+    Arguments:
+        filename -- parsed file name
+        loader -- function which parses file
+        cache_dir -- snapshot directory
+    """
+    stamp = get_stamp(filename)
+    cache_name = get_cache_name(filename, cache_dir)
+    try:
+        with open(cache_name, 'rb') as cache:
+            (cached_stamp, obj) = pickle.load(cache)
+        if cached_stamp == stamp:
+            return obj
+    except (IOError, EOFError, ValueError, TypeError, AttributeError,
+            ImportError, pickle.UnpicklingError):
+        pass
+
+    obj = loader(filename)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        temp_name = '%s.%d' % (cache_name, os.getpid())
+        with open(temp_name, 'wb') as cache:
+            pickle.dump((stamp, obj), cache, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_name, cache_name)
+    except (IOError, OSError, pickle.PicklingError):
+        pass
+    return obj
+
+
+def test():
+    import time
+    from lineinfo import LineInfo
+    from style import Style
+
+    for (filename, loader) in [('data/style.xml', Style.load),
+                               ('data/0001.xml', LineInfo.load)]:
+        for count in range(2):
+            start = time.time()
+            load_cached(filename, loader)
+            print '%s %.2f ms' % (filename, (time.time() - start) * 1000)
+
+
+if __name__ == '__main__':
+    test()
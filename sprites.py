@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Pre-rendered station mark images for LineMap
+"""
+import tilemap
+
+
+__all__ = ['SpriteCache', 'sprite_key']
+
+
+def sprite_key(mark, color, scale=1.0):
+    """Return key of mark image. Text in mark is not part of the image,
+    so marks of a line color share one image.
+    Arguments:
+        mark -- style mark
+        color -- mark color
+        scale -- zoom scale
+    """
+    return (
+        max(1, int(round(mark.radius * scale))),
+        int(round(mark.radius_inside * scale)),
+        color,
+        mark.color_inside,
+        )
+
+
+class SpriteCache(object):
+    """It renders each distinct mark once as a PhotoImage.
+
+    Images shown on canvas must stay referenced, so nothing is evicted
+    until retain() or clear() is called.
+    """
+    def __init__(self, master):
+        """
+        Arguments:
+            master -- Tk widget owning images
+        """
+        self.master = master
+        self.images = {}
+
+    def __len__(self):
+        return len(self.images)
+
+    def get(self, key):
+        """Return PhotoImage of key, render it if not cached.
+        Arguments:
+            key -- value returned by sprite_key
+        """
+        photo = self.images.get(key)
+        if photo is None:
+            photo = tilemap.ImageTk.PhotoImage(self.render(key),
+                                               master=self.master)
+            self.images[key] = photo
+        return photo
+
+    def render(self, key):
+        """Return PIL image of mark, centered as canvas ovals are.
+        Arguments:
+            key -- value returned by sprite_key
+        """
+        (radius, radius_inside, color, color_inside) = key
+        size = radius * 2 + 1
+        image = tilemap.Image.new('RGBA', (size, size), (255, 255, 255, 0))
+        draw = tilemap.ImageDraw.Draw(image)
+        draw.ellipse([0, 0, radius * 2, radius * 2],
+                     outline=color,
+                     fill=color)
+        offset = radius - radius_inside
+        draw.ellipse([offset, offset,
+                      offset + radius_inside * 2,
+                      offset + radius_inside * 2],
+                     outline=color_inside,
+                     fill=color_inside)
+        return image
+
+    def retain(self, keys):
+        """drop images whose key is not in keys
+        Arguments:
+            keys -- keys in use
+        """
+        keys = set(keys)
+        for key in list(self.images):
+            if key not in keys:
+                del self.images[key]
+
+    def clear(self):
+        self.images.clear()
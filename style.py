@@ -2,8 +2,6 @@
 # -*- coding: utf-8 -*-
 """Style
 """
-import xml.dom
-import xml.dom.minidom
 
 
 __all__ = ['Style']
@@ -204,15 +202,21 @@ class Style(object):
 
     @staticmethod
     def parse(element):
-        body = Body.parse(element)
-        station = Station.parse(element)
-        link = Link.parse(element)
-        change = Change.parse(element)
+        # a half edited file misses sections or values
+        try:
+            body = Body.parse(element)
+            station = Station.parse(element)
+            link = Link.parse(element)
+            change = Change.parse(element)
+        except (ValueError, IndexError, AttributeError) as error:
+            from xmlsource import ParseError
+            raise ParseError('broken style: %s' % error)
         return Style(body, station, link, change)
 
     @staticmethod
     def load(filename):
-        dom = xml.dom.minidom.parse(filename)
+        import xmlsource
+        dom = xmlsource.parse(filename)
         return Style.parse(dom)
 
 
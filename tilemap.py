@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Item recorder and tiled raster cache for LineMap
+"""
+import collections
+import os
+import subprocess
+
+# PIL modules, imported by available() on first use
+Image = None
+ImageDraw = None
+ImageFont = None
+ImageTk = None
+
+# result of import, None until available() is called
+LOADED = None
+
+# font family -> TrueType/OpenType file, looked up before fontconfig
+FONT_FILES = {}
+
+# environment variable naming font file for families not in FONT_FILES
+FONT_ENV = 'LINEMAP_FONT'
+
+# result of font lookup, None until font_available() is called
+FONT_FOUND = None
+
+
+__all__ = ['ItemRecorder', 'TileCache', 'available', 'font_available']
+
+
+def available():
+    """Return true if tiles can be rendered, false otherwise.
+    """
+    global Image, ImageDraw, ImageFont, ImageTk, LOADED
+    if LOADED is None:
+        try:
+            # ImageTk is often packaged apart, bind all or none
+            from PIL import Image as image
+            from PIL import ImageDraw as image_draw
+            from PIL import ImageFont as image_font
+            from PIL import ImageTk as image_tk
+        except ImportError:
+            LOADED = False
+        else:
+            (Image, ImageDraw, ImageFont, ImageTk) = (
+                image, image_draw, image_font, image_tk)
+            LOADED = True
+    return LOADED
+
+
+class Item(object):
+    """It keeps canvas item specification.
+    """
+    __slots__ = ['kind', 'coords', 'options', 'top', 'bottom']
+
+    def __init__(self, kind, coords, options):
+        """
+        Arguments:
+            kind -- 'oval', 'text' or 'line'
+            coords -- coordinate list
+            options -- item options
+        """
+        self.kind = kind
+        self.coords = coords
+        self.options = options
+        ys = coords[1::2]
+        if kind == 'text':
+            size = abs(int(font_spec(options)[1] or 12))
+            lines = options.get('text', u'').count(u'\n') + 1
+            self.top = min(ys) - size * lines
+            self.bottom = max(ys) + size * lines
+        else:
+            width = int(options.get('width', 1))
+            self.top = min(ys) - width
+            self.bottom = max(ys) + width
+
+
+def font_spec(options):
+    """Return (family, size, weight) from item options.
+    Arguments:
+        options -- item options
+    """
+    font = list(options.get('font', ()))
+    font += ['', 12, 'normal'][len(font):]
+    return font[:3]
+
+
+class ItemRecorder(object):
+    """It records canvas items instead of drawing them.
+
+    It has the subset of Tk.Canvas used by LineMap.
+    """
+    def __init__(self, tile_height):
+        """
+        Arguments:
+            tile_height -- height of a tile in pixels
+        """
+        self.tile_height = tile_height
+        self.items = []
+        self.rows = {}
+
+    def add(self, kind, coords, options):
+        flat = []
+        for val in coords:
+            if isinstance(val, (tuple, list)):
+                flat.extend(val)
+            else:
+                flat.append(val)
+        item = Item(kind, [int(val) for val in flat], options)
+        oid = len(self.items) + 1
+        self.items.append(item)
+        for row in range(max(0, item.top) // self.tile_height,
+                         max(0, item.bottom) // self.tile_height + 1):
+            self.rows.setdefault(row, []).append(item)
+        return oid
+
+    def create_oval(self, *coords, **options):
+        return self.add('oval', coords, options)
+
+    def create_text(self, *coords, **options):
+        return self.add('text', coords, options)
+
+    def create_line(self, *coords, **options):
+        return self.add('line', coords, options)
+
+    def gen_items(self, row):
+        """items which intersect tile
+        Arguments:
+            row -- tile row
+        """
+        for item in self.rows.get(row, []):
+            yield item
+
+
+def find_font_file(family, weight=''):
+    """Return font file of family.
+    Arguments:
+        family -- font family or font file name
+        weight -- 'bold' or normal
+    Raises:
+        IOError -- no font file is found
+    """
+    path = FONT_FILES.get(family)
+    if path:
+        return path
+    if family and os.path.isfile(family):
+        return family
+    path = os.environ.get(FONT_ENV)
+    if path:
+        return path
+    pattern = family or u'sans-serif'
+    if weight == 'bold':
+        pattern += u':weight=bold'
+    if isinstance(pattern, unicode):
+        pattern = pattern.encode('utf-8')
+    try:
+        process = subprocess.Popen(['fc-match', '-f', '%{file}', pattern],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        (path, error) = process.communicate()
+    except OSError:
+        path = None
+    if path and os.path.isfile(path):
+        return path
+    raise IOError('no font file for %r, set tilemap.FONT_FILES or %s' % (
+        family, FONT_ENV))
+
+
+def font_available():
+    """Return true if a font file for text in tiles is found, false
+    otherwise, e.g. without fontconfig and FONT_FILES or FONT_ENV.
+    """
+    global FONT_FOUND
+    if FONT_FOUND is None:
+        try:
+            find_font_file('')
+        except IOError:
+            FONT_FOUND = False
+        else:
+            FONT_FOUND = True
+    return FONT_FOUND
+
+
+class TileRenderer(object):
+    """It renders recorded items into an image.
+    """
+    def __init__(self):
+        self.fonts = {}
+
+    def get_font(self, family, size, weight=''):
+        """Return font of family and size in pixels, PIL default font if
+        no font file is found.
+        """
+        key = (family, size, weight)
+        font = self.fonts.get(key)
+        if font is None:
+            try:
+                font = ImageFont.truetype(find_font_file(family, weight),
+                                          abs(int(size or 12)))
+            except IOError:
+                # a tile must not fail while scrolling
+                font = ImageFont.load_default()
+            self.fonts[key] = font
+        return font
+
+    def render(self, items, width, top, height):
+        """
+        Arguments:
+            items -- Item object list
+            width -- tile width
+            top -- tile top position
+            height -- tile height
+        """
+        image = Image.new('RGB', (width, height), '#fff')
+        draw = ImageDraw.Draw(image)
+        for item in items:
+            coords = [val - top if idx % 2 else val
+                      for (idx, val) in enumerate(item.coords)]
+            opts = item.options
+            if item.kind == 'oval':
+                draw.ellipse(coords,
+                             outline=opts.get('outline'),
+                             fill=opts.get('fill'))
+            elif item.kind == 'line':
+                draw.line(coords,
+                          fill=opts.get('fill', '#000'),
+                          width=int(opts.get('width', 1)))
+            elif item.kind == 'text':
+                self.draw_text(draw, coords, opts)
+        return image
+
+    def draw_text(self, draw, coords, opts):
+        (family, size, weight) = font_spec(opts)
+        font = self.get_font(family, size, weight)
+        text = opts.get('text', u'')
+        if hasattr(draw, 'textbbox'):
+            # Pillow 10 removed textsize
+            (left, upper, right, lower) = draw.textbbox((0, 0), text,
+                                                        font=font)
+            (text_width, text_height) = (right - left, lower - upper)
+        else:
+            (text_width, text_height) = draw.textsize(text, font=font)
+        (pos_x, pos_y) = coords[:2]
+        anchor = opts.get('anchor', 'center')
+        if anchor == 'center':
+            pos_x -= text_width // 2
+            pos_y -= text_height // 2
+        elif anchor == 'w':
+            pos_y -= text_height // 2
+        draw.text((pos_x, pos_y), text,
+                  font=font,
+                  fill=opts.get('fill', '#000'))
+
+
+class TileCache(object):
+    """It keeps rendered tiles in LRU order and places visible ones.
+    """
+    def __init__(self, canvas, recorder, width, height, max_tiles=16):
+        """
+        Arguments:
+            canvas -- Tk.Canvas
+            recorder -- ItemRecorder object
+            width -- map width
+            height -- map height
+            max_tiles -- number of tiles kept
+        """
+        self.canvas = canvas
+        self.recorder = recorder
+        self.width = width
+        self.height = height
+        self.max_tiles = max_tiles
+        self.renderer = TileRenderer()
+        self.images = collections.OrderedDict()
+        self.placed = {}
+
+    @property
+    def tile_height(self):
+        return self.recorder.tile_height
+
+    def get_tile(self, row):
+        """Return PhotoImage of tile, render it if not cached.
+        Arguments:
+            row -- tile row
+        """
+        photo = self.images.pop(row, None)
+        if photo is None:
+            top = row * self.tile_height
+            image = self.renderer.render(
+                self.recorder.gen_items(row),
+                self.width,
+                top,
+                min(self.tile_height, self.height - top))
+            photo = ImageTk.PhotoImage(image)
+        self.images[row] = photo
+        while len(self.images) > self.max_tiles:
+            self.images.popitem(last=False)
+        return photo
+
+    def visible_rows(self):
+        """Return tile rows which intersect the viewport.
+        """
+        top = int(self.canvas.canvasy(0))
+        bottom = int(self.canvas.canvasy(self.canvas.winfo_height()))
+        last_row = max(0, self.height - 1) // self.tile_height
+        return range(max(0, top // self.tile_height),
+                     min(last_row, bottom // self.tile_height) + 1)
+
+    def place(self):
+        """place visible tiles on canvas and remove others
+        """
+        rows = self.visible_rows()
+        for row in list(self.placed):
+            if row not in rows:
+                (oid, photo) = self.placed.pop(row)
+                self.canvas.delete(oid)
+        for row in rows:
+            if row in self.placed:
+                continue
+            # placed tiles keep their image even if it leaves the LRU
+            photo = self.get_tile(row)
+            oid = self.canvas.create_image(0, row * self.tile_height,
+                                           anchor='nw',
+                                           image=photo,
+                                           tags='tile')
+            # keep markers drawn over the map, e.g. trains, above tiles
+            self.canvas.lower(oid)
+            self.placed[row] = (oid, photo)
+
+    def clear(self):
+        """remove tiles from canvas and forget them
+        """
+        for (oid, photo) in self.placed.values():
+            self.canvas.delete(oid)
+        self.placed.clear()
+        self.images.clear()
+
+
+def test():
+    """open file in raster mode
+    """
+    from lineinfo import LineInfo
+    from lineinfo import Span
+    from linemap import LineMap
+    from style import Style
+
+    style = Style.load('data/style.xml')
+    infos = LineInfo.load('data/0001.xml')
+
+    line_map = LineMap(raster=True)
+    line_map.draw(infos, style, Span(-1, 0, -1))
+    line_map.mainloop()
+
+
+if __name__ == '__main__':
+    test()
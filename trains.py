@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Animated train positions on LineMap
+"""
+import bisect
+import collections
+import time
+
+from lineinfo import Timetable
+
+
+__all__ = ['TrainAnimator', 'FrameStats']
+
+# minutes of a day
+DAY_MINUTES = 24 * 60
+
+
+def percentile(values, rate):
+    """Return value at rate of sorted values, 0 if empty.
+    Arguments:
+        values -- sorted number list
+        rate -- 0.0 to 1.0
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * rate))]
+
+
+class FrameStats(object):
+    """It keeps work time and interval of recent frames.
+    """
+    def __init__(self, size=600):
+        """
+        Arguments:
+            size -- number of frames kept
+        """
+        self.works = collections.deque(maxlen=size)
+        self.gaps = collections.deque(maxlen=size)
+        self.frames = 0
+        self.last = None
+
+    def add(self, start, work):
+        """record frame
+        Arguments:
+            start -- time.time() at frame start
+            work -- seconds spent in frame
+        """
+        if self.last is not None:
+            self.gaps.append(start - self.last)
+        self.last = start
+        self.works.append(work)
+        self.frames += 1
+
+    def report(self):
+        """Return {'frames', 'fps', 'mean', 'p99', 'max', 'max_gap'},
+        times in milliseconds.
+        """
+        works = sorted(self.works)
+        gaps = list(self.gaps)
+        fps = 0.0
+        if gaps:
+            fps = len(gaps) / max(sum(gaps), 1e-6)
+        return {
+            'frames': self.frames,
+            'fps': fps,
+            'mean': works and sum(works) * 1000 / len(works) or 0.0,
+            'p99': percentile(works, 0.99) * 1000,
+            'max': works and works[-1] * 1000 or 0.0,
+            'max_gap': gaps and max(gaps) * 1000 or 0.0,
+            }
+
+    def format(self):
+        return ('%(frames)d frames %(fps).1f fps, frame mean %(mean).2f ms '
+                'p99 %(p99).2f ms max %(max).2f ms, '
+                'max interval %(max_gap).1f ms' % self.report())
+
+
+class TrainPath(object):
+    """It keeps key frames of a trip in map coordinates.
+    """
+    __slots__ = ['code', 'times', 'points', 'begin', 'end', 'side']
+
+    def __init__(self, trip, positions):
+        """
+        Arguments:
+            trip -- Trip object
+            positions -- {station index: Point} of drawn stations
+        """
+        self.code = trip.code
+        self.times = []
+        # (x, y) or None if station is not drawn
+        self.points = []
+        for stop in trip.stops:
+            center = positions.get(stop.idx)
+            if center is not None:
+                center = (center.x, center.y)
+            self.times.append(stop.arrival)
+            self.points.append(center)
+            if stop.departure != stop.arrival:
+                self.times.append(stop.departure)
+                self.points.append(center)
+        self.begin = self.times and self.times[0] or 0
+        self.end = self.times and self.times[-1] or 0
+        drawn = [point for point in self.points if point is not None]
+        # trains running down the map are shown left of the line
+        self.side = 1
+        if len(drawn) >= 2 and drawn[-1][1] > drawn[0][1]:
+            self.side = -1
+
+    def get_position(self, clock):
+        """Return (x, y) at clock, None if not running on drawn links.
+        Arguments:
+            clock -- minutes after midnight
+        """
+        times = self.times
+        pos = bisect.bisect_right(times, clock) - 1
+        if pos < 0:
+            return None
+        if pos >= len(times) - 1:
+            if clock > times[-1]:
+                return None
+            return self.points[-1]
+        (point1, point2) = self.points[pos:pos + 2]
+        if point1 is None or point2 is None:
+            return None
+        rate = (clock - times[pos]) / float(times[pos + 1] - times[pos])
+        return (point1[0] + (point2[0] - point1[0]) * rate,
+                point1[1] + (point2[1] - point1[1]) * rate)
+
+
+class TrainAnimator(object):
+    """It moves train markers on a drawn LineMap.
+
+    Trips are turned into key frames of drawn station centers once, so a
+    frame is only interpolation. Markers of all trains are moved by one
+    Tcl script per frame, and trains outside of the viewport are not
+    moved at all.
+    """
+    def __init__(self, line_map, timetable=None, headway=6, clock=None,
+                 speed=1.0, fps=30, radius=5):
+        """
+        Arguments:
+            line_map -- drawn LineMap
+            timetable -- Timetable object, timetable of line or trips
+                         every headway minutes if None
+            headway -- minutes between simulated trips
+            clock -- minutes after midnight at start, now if None
+            speed -- simulated minutes per second
+            fps -- frames per second
+            radius -- marker radius in pixels
+        """
+        self.line_map = line_map
+        self.view = line_map.view
+        self.timetable = timetable
+        self.headway = headway
+        if clock is None:
+            now = time.localtime()
+            clock = now.tm_hour * 60 + now.tm_min + now.tm_sec / 60.0
+        self.start_clock = clock
+        self.start_time = None
+        self.speed = speed
+        self.interval = 1000.0 / fps
+        self.radius = radius
+        self.stats = FrameStats()
+        self.job = None
+        self.nodes = None
+        self.paths = []
+        self.begins = []
+        # paths begun and not yet ended at last_clock, next path to begin
+        self.active = []
+        self.next = 0
+        self.last_clock = None
+        self.period = (0, DAY_MINUTES)
+        self.markers = []
+        self.shown = 0
+        self.culled = 0
+
+    def get_timetable(self):
+        line_info = self.line_map.line_info
+        if self.timetable is not None:
+            return self.timetable
+        if line_info.timetable is not None:
+            return line_info.timetable
+        return Timetable.from_headway(line_info, 0, DAY_MINUTES - 1,
+                                      self.headway)
+
+    def rebuild(self):
+        """make key frames and markers for drawn map
+        """
+        line_map = self.line_map
+        self.nodes = line_map.nodes
+        positions = dict(line_map.nodes)
+        paths = [TrainPath(trip, positions)
+                 for trip in self.get_timetable().trips]
+        paths = [path for path in paths if path.end > path.begin]
+        paths.sort(key=lambda path: path.begin)
+        self.paths = paths
+        self.begins = [path.begin for path in paths]
+        self.active = []
+        self.next = 0
+        self.last_clock = None
+        if paths:
+            self.period = (paths[0].begin, max([path.end for path in paths]))
+        # markers were deleted with the old drawing
+        self.view.delete('train')
+        self.markers = []
+        self.shown = 0
+
+    def get_clock(self, now):
+        """Return minutes after midnight at time now, looping within
+        running hours.
+        """
+        clock = self.start_clock + (now - self.start_time) * self.speed
+        (begin, end) = self.period
+        if end > begin:
+            clock = begin + (clock - begin) % (end - begin)
+        return clock
+
+    def get_marker(self, pos):
+        while len(self.markers) <= pos:
+            oid = self.view.create_oval(
+                0, 0, 0, 0,
+                fill=self.line_map.line_info.line.color,
+                outline=self.line_map.style.station.mark.color_inside,
+                width=2,
+                state='hidden',
+                tags='train')
+            self.markers.append(oid)
+        return self.markers[pos]
+
+    def update_active(self, clock):
+        """Return paths running at clock. The clock only moves forward
+        between loops, so paths are added as they begin and dropped as
+        they end instead of scanning every path begun so far.
+        Arguments:
+            clock -- minutes after midnight
+        """
+        if self.last_clock is None or clock < self.last_clock:
+            self.active = []
+            self.next = 0
+        self.last_clock = clock
+        end = bisect.bisect_right(self.begins, clock)
+        active = self.active
+        active.extend(self.paths[self.next:end])
+        self.next = end
+        if any(path.end < clock for path in active):
+            active = [path for path in active if path.end >= clock]
+            self.active = active
+        return active
+
+    def gen_visible(self, clock):
+        """(x, y) generator of trains in viewport, canvas coordinates
+        Arguments:
+            clock -- minutes after midnight
+        """
+        scale = self.line_map.zoom_scale
+        offset = (self.line_map.style.station.mark.radius + self.radius + 2)
+        (top, bottom) = self.line_map.get_visible_range()
+        top -= self.radius
+        bottom += self.radius
+        self.culled = 0
+        for path in self.update_active(clock):
+            point = path.get_position(clock)
+            if point is None:
+                continue
+            y = point[1] * scale
+            if not top <= y <= bottom:
+                self.culled += 1
+                continue
+            yield ((point[0] + offset * path.side) * scale, y)
+
+    def draw_frame(self, clock):
+        """move markers to clock by one Tcl script
+        Arguments:
+            clock -- minutes after midnight
+        """
+        if self.line_map.nodes is not self.nodes:
+            self.rebuild()
+        widget = self.view._w
+        radius = self.radius
+        commands = []
+        count = 0
+        for (x, y) in self.gen_visible(clock):
+            oid = self.get_marker(count)
+            commands.append('%s coords %d %.1f %.1f %.1f %.1f' % (
+                widget, oid, x - radius, y - radius, x + radius, y + radius))
+            if count >= self.shown:
+                commands.append('%s itemconfigure %d -state normal' % (
+                    widget, oid))
+            count += 1
+        for oid in self.markers[count:self.shown]:
+            commands.append('%s itemconfigure %d -state hidden' % (
+                widget, oid))
+        if count > self.shown:
+            commands.append('%s raise train' % widget)
+        self.shown = count
+        if commands:
+            self.view.tk.eval('\n'.join(commands))
+        return count
+
+    def run(self):
+        self.job = None
+        start = time.time()
+        self.draw_frame(self.get_clock(start))
+        work = time.time() - start
+        self.stats.add(start, work)
+        delay = max(1, int(self.interval - work * 1000))
+        self.job = self.view.after(delay, self.run)
+
+    def start(self):
+        """start animation
+        """
+        self.stop()
+        if self.line_map.line_info is None:
+            return
+        if self.start_time is None:
+            self.start_time = time.time()
+        self.job = self.view.after_idle(self.run)
+
+    def stop(self):
+        """stop animation, markers stay where they are
+        """
+        if self.job is not None:
+            self.view.after_cancel(self.job)
+            self.job = None
+
+    def is_running(self):
+        return self.job is not None
+
+
+def test():
+    """animate trains on sample line and print frame times
+    """
+    import sys
+
+    from lineinfo import LineInfo
+    from lineinfo import Span
+    from linemap import LineMap
+    from style import Style
+
+    style = Style.load('data/style.xml')
+    infos = LineInfo.load('data/0001.xml')
+
+    line_map = LineMap()
+    line_map.draw(infos, style, Span(0, -1))
+    line_map.finish()
+    animator = TrainAnimator(line_map, headway=2, speed=2.0, fps=60)
+    animator.start()
+
+    def report():
+        sys.stdout.write('%d shown, %d culled, %s\n' % (
+            animator.shown, animator.culled, animator.stats.format()))
+        line_map.after(2000, report)
+
+    line_map.after(2000, report)
+    line_map.mainloop()
+
+
+if __name__ == '__main__':
+    test()
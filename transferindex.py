@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Index resolving changes between loaded lines
+"""
+from lineinfo import LineInfo
+from lineinfo import gen_line_files
+
+
+__all__ = ['TransferIndex', 'Problem']
+
+
+class Problem(object):
+    """It keeps a change which is not resolved as written.
+    """
+    __slots__ = ['kind', 'line_info', 'change', 'found']
+
+    # change has no line code or station code
+    NO_CODE = 'no-code'
+    # no loaded line has line code
+    UNKNOWN_LINE = 'unknown-line'
+    # line is loaded but has no station code
+    UNKNOWN_STATION = 'unknown-station'
+    # resolved station has other line or station name
+    NAME_MISMATCH = 'name-mismatch'
+    # code is used by more than one station
+    DUPLICATE = 'duplicate'
+    # line code is used by more than one line
+    DUPLICATE_LINE = 'duplicate-line'
+    # change idx is no station of its line
+    MISSING_STATION = 'missing-station'
+    # change would join two stations of one line
+    SAME_LINE = 'same-line'
+
+    def __init__(self, kind, line_info, change, found=None):
+        """
+        Arguments:
+            kind -- one of kinds above
+            line_info -- LineInfo object having change
+            change -- Change object, None for duplicate
+            found -- resolved (LineInfo, idx) or None, idx is None for
+                     duplicate line
+        """
+        self.kind = kind
+        self.line_info = line_info
+        self.change = change
+        self.found = found
+
+    def __unicode__(self):
+        if self.change is None:
+            (other, idx) = self.found
+            if idx is None:
+                return u'%s: %s %s and %s' % (
+                    self.kind,
+                    self.line_info.line.name,
+                    self.line_info.line.code,
+                    other.line.name,
+                    )
+            return u'%s: %s %s and %s %s' % (
+                self.kind,
+                self.line_info.line.name,
+                self.line_info.line.code,
+                other.line.name,
+                other.get_station_name(idx),
+                )
+        text = u'%s: %s #%d -> %s %s / %s %s' % (
+            self.kind,
+            self.line_info.line.name,
+            self.change.idx,
+            self.change.line.name,
+            self.change.line.code,
+            self.change.station.name,
+            self.change.station.code,
+            )
+        if self.found is not None:
+            (other, idx) = self.found
+            text += u' (%s %s)' % (other.line.name,
+                                   other.get_station_name(idx))
+        return text
+
+
+class TransferIndex(object):
+    """It maps (line code, station code) to (LineInfo, idx) and groups
+    stations joined by changes into physical stations.
+
+    Changes with name mismatch are not joined, and a group never has two
+    stations of one line, so a wrong code can not merge neighbouring
+    stations through other lines.
+    """
+    def __init__(self, line_infos):
+        """
+        Arguments:
+            line_infos -- LineInfo object list
+        """
+        self.line_infos = list(line_infos)
+        self.lines = {}
+        self.stations = {}
+        self.problems = []
+        # station node is (line position, idx), parents form union find
+        self.parents = {}
+        # root node -> line positions in group
+        self.group_lines = {}
+        # node -> set of nodes joined by a change either way
+        self.edges = {}
+        self.groups = None
+        self.positions = dict([(id(line_info), line_pos) for
+                               (line_pos, line_info)
+                               in enumerate(self.line_infos)])
+
+        for (line_pos, line_info) in enumerate(self.line_infos):
+            code = line_info.line.code
+            if code in self.lines:
+                self.problems.append(Problem(
+                    Problem.DUPLICATE_LINE, line_info, None,
+                    (self.lines[code], None)))
+            elif code:
+                self.lines[code] = line_info
+            for station in line_info.stations:
+                node = (line_pos, station.idx)
+                self.parents[node] = node
+                self.group_lines[node] = set([line_pos])
+                if not code or not station.code:
+                    continue
+                key = (code, station.code)
+                found = self.stations.get(key)
+                if found is not None:
+                    self.problems.append(Problem(
+                        Problem.DUPLICATE, line_info, None, found))
+                    continue
+                self.stations[key] = (line_info, station.idx)
+
+        for (line_pos, line_info) in enumerate(self.line_infos):
+            for change in line_info.changes:
+                found = self.check(line_info, change)
+                if found is None or not self.matches(change, found):
+                    continue
+                (other, idx) = found
+                node = (line_pos, change.idx)
+                other_node = (self.positions[id(other)], idx)
+                if node not in self.parents:
+                    self.problems.append(Problem(
+                        Problem.MISSING_STATION, line_info, change, found))
+                    continue
+                if not self.union(node, other_node):
+                    self.problems.append(Problem(
+                        Problem.SAME_LINE, line_info, change, found))
+                    continue
+                self.edges.setdefault(node, set()).add(other_node)
+                self.edges.setdefault(other_node, set()).add(node)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def check(self, line_info, change):
+        """Return resolved (LineInfo, idx) of change, None if unresolved.
+        Problems found are recorded.
+        Arguments:
+            line_info -- LineInfo object having change
+            change -- Change object
+        """
+        if not change.has_code():
+            self.problems.append(Problem(Problem.NO_CODE, line_info, change))
+            return None
+        if change.line.code not in self.lines:
+            self.problems.append(
+                Problem(Problem.UNKNOWN_LINE, line_info, change))
+            return None
+        found = self.resolve(change)
+        if found is None:
+            self.problems.append(
+                Problem(Problem.UNKNOWN_STATION, line_info, change))
+            return None
+        if not self.matches(change, found):
+            self.problems.append(
+                Problem(Problem.NAME_MISMATCH, line_info, change, found))
+        return found
+
+    def matches(self, change, found):
+        """Return true if names of change agree with resolved station.
+        Arguments:
+            change -- Change object
+            found -- resolved (LineInfo, idx)
+        """
+        (other, idx) = found
+        if change.line.name and change.line.name != other.line.name:
+            return False
+        if change.station.name and \
+                change.station.name != other.get_station_name(idx):
+            return False
+        return True
+
+    def find(self, node):
+        parents = self.parents
+        root = node
+        while parents[root] != root:
+            root = parents[root]
+        while parents[node] != root:
+            (parents[node], node) = (root, parents[node])
+        return root
+
+    def union(self, node, other):
+        """join groups of nodes
+        Returns:
+            false if a group would have two stations of one line
+        """
+        if node not in self.parents or other not in self.parents:
+            return False
+        (root, other_root) = (self.find(node), self.find(other))
+        if root == other_root:
+            return True
+        lines = self.group_lines[root]
+        other_lines = self.group_lines[other_root]
+        if lines & other_lines:
+            return False
+        self.parents[other_root] = root
+        lines.update(other_lines)
+        del self.group_lines[other_root]
+        self.groups = None
+        return True
+
+    def get_node(self, line_info, idx):
+        idx = int(idx)
+        while idx < 0:
+            idx += len(line_info.stations)
+        return (self.positions[id(line_info)], idx)
+
+    def resolve(self, change):
+        """Return (LineInfo, idx) which change points at, None if unknown.
+        Arguments:
+            change -- Change object
+        """
+        return self.stations.get((change.line.code, change.station.code))
+
+    def lookup(self, line_code, station_code):
+        """Return (LineInfo, idx) of codes, None if unknown.
+        Arguments:
+            line_code -- line code
+            station_code -- station code
+        """
+        return self.stations.get((line_code, station_code))
+
+    def get_lines(self, line_info, idx):
+        """Return (LineInfo, idx) list of lines serving physical station,
+        station itself first.
+        Arguments:
+            line_info -- one of line infos given to constructor
+            idx -- station index
+        """
+        node = self.get_node(line_info, idx)
+        if self.groups is None:
+            self.groups = {}
+            for member in sorted(self.parents):
+                self.groups.setdefault(self.find(member), []).append(member)
+        group = self.groups.get(self.find(node), [node])
+        return [(line_info, node[1])] + [
+            (self.line_infos[line_pos], other_idx)
+            for (line_pos, other_idx) in group
+            if (line_pos, other_idx) != node]
+
+    def get_changes(self, line_info, idx):
+        """Return (LineInfo, idx) list of stations joined to station by
+        a change, either way, without following further changes.
+        Arguments:
+            line_info -- one of line infos given to constructor
+            idx -- station index
+        """
+        return [(self.line_infos[line_pos], other_idx)
+                for (line_pos, other_idx)
+                in sorted(self.edges.get(self.get_node(line_info, idx), ()))]
+
+    def get_transfers(self, line_info, idx):
+        """Return (LineInfo, idx) list of other lines at physical station.
+        Arguments:
+            line_info -- one of line infos given to constructor
+            idx -- station index
+        """
+        return self.get_lines(line_info, idx)[1:]
+
+    def report(self):
+        """Return unicode lines describing problems.
+        """
+        return [unicode(problem) for problem in self.problems]
+
+    @classmethod
+    def load(cls, dirname):
+        """load line files in directory and index them
+        Arguments:
+            dirname -- directory of line files
+        """
+        return cls([LineInfo.load(filename)
+                    for filename in gen_line_files(dirname)])
+
+
+def test():
+    """index sample lines and show problems
+    """
+    import time
+
+    start = time.time()
+    index = TransferIndex.load('data')
+    print '%d lines, %d stations indexed in %.1f ms' % (
+        len(index.line_infos), len(index), (time.time() - start) * 1000)
+    line_info = index.line_infos[0]
+    for (other, idx) in index.get_lines(line_info, 0):
+        print (u'%s %s' % (other.line.name,
+                           other.get_station_name(idx))).encode('utf-8')
+    for line in index.report():
+        print line.encode('utf-8')
+    print '%d problems' % len(index.problems)
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""XML input from plain or compressed files and file objects
+"""
+import os
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+__all__ = ['open_xml', 'parse', 'strip_suffix', 'ParseError', 'SUFFIXES']
+
+# suffixes of compressed files, for directory listings
+SUFFIXES = ['.gz', '.xz', '.zst']
+
+# bytes read from source at once
+CHUNK_SIZE = 1 << 16
+
+
+def make_gzip():
+    # 16 + MAX_WBITS expects gzip header and trailer
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def make_xz():
+    if lzma is None:
+        raise IOError('xz compressed file needs lzma module')
+    return lzma.LZMADecompressor()
+
+
+def make_zstd():
+    if zstandard is None:
+        raise IOError('zstd compressed file needs zstandard module')
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+# errors of broken compressed data
+ERRORS = (zlib.error,)
+if lzma is not None:
+    ERRORS += (lzma.LZMAError,)
+if zstandard is not None:
+    ERRORS += (zstandard.ZstdError,)
+
+# magic bytes, decompressor factory
+MAGICS = [
+    ('\x1f\x8b', make_gzip),
+    ('\xfd7zXZ\x00', make_xz),
+    ('\x28\xb5\x2f\xfd', make_zstd),
+    ]
+
+
+class ParseError(ValueError):
+    """It is raised for well-formed xml missing elements or values.
+    """
+    pass
+
+
+class DecompressedFile(object):
+    """It is a read-only file decompressing source while read.
+
+    Concatenated streams, e.g. multi-member gzip files, are read as one.
+    """
+    def __init__(self, source, factory, head=''):
+        """
+        Arguments:
+            source -- file object of compressed data
+            factory -- function returning object having decompress(data)
+            head -- bytes already read from source
+        """
+        self.source = source
+        self.factory = factory
+        self.decompressor = factory()
+        self.head = head
+        # decompressed bytes not read yet start at buffer[pos]
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def decompress(self, data):
+        """Return decompressed data, a decompressor is made for each
+        stream and zero padding between streams is skipped.
+        """
+        chunks = []
+        while data:
+            if self.decompressor is None:
+                data = data.lstrip('\x00')
+                if not data:
+                    break
+                self.decompressor = self.factory()
+            chunks.append(self.decompressor.decompress(data))
+            # bytes after the end of stream
+            data = getattr(self.decompressor, 'unused_data', '')
+            if data:
+                self.decompressor = None
+        return ''.join(chunks)
+
+    def fill(self, size):
+        if self.eof or 0 <= size <= len(self.buffer) - self.pos:
+            return
+        chunks = [self.buffer[self.pos:]]
+        count = len(chunks[0])
+        while size < 0 or count < size:
+            data = self.head or self.source.read(CHUNK_SIZE)
+            self.head = ''
+            if not data:
+                self.eof = True
+                break
+            try:
+                data = self.decompress(data)
+            except ERRORS as error:
+                raise IOError('broken compressed data: %s' % error)
+            chunks.append(data)
+            count += len(data)
+        self.buffer = ''.join(chunks)
+        self.pos = 0
+
+    def read(self, size=-1):
+        self.fill(size)
+        (buffer, pos) = (self.buffer, self.pos)
+        if size < 0 or pos + size >= len(buffer):
+            self.buffer = ''
+            self.pos = 0
+            return pos and buffer[pos:] or buffer
+        self.pos = pos + size
+        return buffer[pos:pos + size]
+
+    def close(self):
+        self.source.close()
+
+
+class HeadFile(object):
+    """It is a read-only file returning peeked bytes before the rest.
+    """
+    def __init__(self, source, head):
+        """
+        Arguments:
+            source -- file object
+            head -- bytes already read from source
+        """
+        self.source = source
+        self.head = head
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.source.read(size)
+        if 0 <= size <= len(self.head):
+            (data, self.head) = (self.head[:size], self.head[size:])
+            return data
+        data = self.head + self.source.read(
+            size < 0 and -1 or size - len(self.head))
+        self.head = ''
+        return data
+
+    def close(self):
+        self.source.close()
+
+
+def open_xml(source):
+    """Return file object reading xml of source, compressed source is
+    decompressed while read.
+    Arguments:
+        source -- file name or file object
+    """
+    if isinstance(source, basestring):
+        source = open(source, 'rb', CHUNK_SIZE)
+    head = source.read(8)
+    for (magic, factory) in MAGICS:
+        if head.startswith(magic):
+            return DecompressedFile(source, factory, head)
+    return HeadFile(source, head)
+
+
+def parse(source):
+    """Return minidom document of source.
+    Arguments:
+        source -- file name or file object, plain or compressed
+    """
+    import xml.dom.minidom
+    if isinstance(source, basestring):
+        with open(source, 'rb', CHUNK_SIZE) as raw_file:
+            return xml.dom.minidom.parse(open_xml(raw_file))
+    return xml.dom.minidom.parse(open_xml(source))
+
+
+def strip_suffix(filename):
+    """Return file name without compression suffix.
+    Arguments:
+        filename -- file name
+    """
+    (root, ext) = os.path.splitext(filename)
+    if ext in SUFFIXES:
+        return root
+    return filename
+
+
+def test():
+    """parse plain and gzip line file
+    """
+    import gzip
+    import tempfile
+    import time
+
+    filename = 'data/0001.xml'
+    with open(filename, 'rb') as xml_file:
+        data = xml_file.read()
+    (handle, temp_name) = tempfile.mkstemp(suffix='.xml.gz')
+    os.close(handle)
+    with open(temp_name, 'wb') as raw_file:
+        gzip_file = gzip.GzipFile(fileobj=raw_file, mode='wb')
+        gzip_file.write(data)
+        gzip_file.close()
+    for name in [filename, temp_name]:
+        start = time.time()
+        dom = parse(name)
+        print '%s %d bytes, %d stations, %.1f ms' % (
+            name, os.path.getsize(name),
+            len(dom.getElementsByTagName('station')),
+            (time.time() - start) * 1000)
+    os.remove(temp_name)
+
+
+if __name__ == '__main__':
+    test()